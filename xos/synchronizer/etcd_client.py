@@ -0,0 +1,154 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import etcd3
+from multistructlog import create_logger
+from xosconfig import Config
+
+from helpers import Helpers
+
+log = create_logger(Config().get('logging'))
+
+
+class EtcdClient(object):
+    """
+    A client for the ETCD used by VOLTHA.
+
+    Creating an etcd3 client opens a new gRPC channel, so a client is created once per ETCD endpoint and shared by all
+    the steps (and threads) talking to it. If the connection fails the underlying etcd3 client is dropped and the
+    operation is retried once with a new one.
+    """
+
+    # timeout (in seconds) of the ETCD operations
+    timeout = 10
+
+    # maximum number of operations in a transaction (the default limit of ETCD)
+    max_txn_ops = 128
+
+    _lock = threading.Lock()
+    _clients = {}
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+        self._client_lock = threading.Lock()
+        self._client = None
+
+    @classmethod
+    def for_service(cls, volt_service):
+        """
+        Return the client for the ETCD used by volt_service.
+        :param volt_service: VOLTService
+        :return: EtcdClient
+        """
+        etcd = Helpers.get_etcd_info(volt_service)
+        return cls.for_endpoint(etcd['url'], etcd['port'])
+
+    @classmethod
+    def for_endpoint(cls, host, port):
+        key = (host, port)
+
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = cls(host, port)
+            return cls._clients[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._clients = {}
+
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = etcd3.client(host=self.host, port=self.port, timeout=self.timeout)
+            return self._client
+
+    def reconnect(self, client):
+        with self._client_lock:
+            # another thread may have reconnected already
+            if self._client is client:
+                self._client = None
+
+    def call(self, operation):
+        """
+        Run operation (a function of the etcd3 client), on a new client if the connection fails.
+        """
+        client = self.client()
+        try:
+            return operation(client)
+        except (etcd3.exceptions.ConnectionFailedError, etcd3.exceptions.ConnectionTimeoutError), e:
+            log.warning("Connection to ETCD failed, reconnecting", host=self.host, port=self.port, reason=e)
+            self.reconnect(client)
+            return operation(self.client())
+
+    def get(self, key):
+        return self.call(lambda client: client.get(key))
+
+    def get_prefix(self, prefix):
+        """
+        Read all the keys starting with prefix, with a single request.
+        :return: dict - key -> value
+        """
+        return self.call(lambda client: dict((m.key, v) for (v, m) in client.get_prefix(prefix)))
+
+    def put(self, key, value):
+        return self.call(lambda client: client.put(key, value))
+
+    def delete(self, key):
+        """
+        Delete key with a single request.
+        :return: True if the key was there
+        """
+        return self.call(lambda client: client.delete(key))
+
+    def watch_prefix(self, prefix, callback):
+        """
+        Call callback with every change (an etcd3 PutEvent or DeleteEvent) of the keys starting with prefix.
+        If the watch fails, ie: because the connection is lost, callback is called with the exception and the watch has
+        to be created again.
+        :return: the watch id
+        """
+        range_end = etcd3.utils.increment_last_byte(etcd3.utils.to_bytes(prefix))
+
+        def watch(client):
+            def on_event(event):
+                if isinstance(event, Exception):
+                    # the watcher of an etcd3 client can't be restarted, the next calls need a new client
+                    self.reconnect(client)
+                callback(event)
+
+            return client.add_watch_callback(prefix, on_event, range_end=range_end)
+
+        return self.call(watch)
+
+    def transaction(self, puts=None, deletes=None):
+        """
+        Put and delete keys in transactions of at most max_txn_ops operations.
+        :param puts: dict - key -> value
+        :param deletes: list - keys
+        """
+        ops = [("put", k, v) for (k, v) in (puts or {}).items()] + [("delete", k, None) for k in (deletes or [])]
+
+        def run(client, batch):
+            success = [client.transactions.put(k, v) if op == "put" else client.transactions.delete(k)
+                       for (op, k, v) in batch]
+            return client.transaction(compare=[], success=success, failure=[])
+
+        for i in range(0, len(ops), self.max_txn_ops):
+            batch = ops[i:i + self.max_txn_ops]
+            self.call(lambda client: run(client, batch))
@@ -17,15 +17,90 @@
 import json
 import os
 import sys
+import threading
+import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from xossynchronizer.event_steps.eventstep import EventStep
-from xossynchronizer.modelaccessor import VOLTService, VOLTServiceInstance, Service
+from xossynchronizer.modelaccessor import VOLTService, ServiceDependency
 from xosconfig import Config
 from multistructlog import create_logger
 from helpers import Helpers
+from subscriber_replay import SubscriberReplay
 
 log = create_logger(Config().get('logging'))
 
+class OnosServiceIndex(object):
+    """
+    The vOLTServices by the name of their ONOS service.
+
+    Most of the pod events are for other services, and finding the ONOS service of a vOLTService means walking its
+    provider services. The index is built once, and after ttl seconds it is rebuilt only if the vOLTServices or their
+    links to the provider services changed, so that an event for another service is dropped without any query.
+    """
+
+    # the vOLTServices and their links are checked for changes after this many seconds
+    ttl = 60
+
+    _lock = threading.Lock()
+    _services = None  # lowercase ONOS service name -> ids of the vOLTServices using it
+    _signature = None
+    _checked_at = 0
+
+    @staticmethod
+    def signature(volt_services):
+        ids = set(s.id for s in volt_services)
+        links = [d for d in ServiceDependency.objects.all() if d.subscriber_service_id in ids]
+        return (sorted((s.id, s.updated) for s in volt_services), sorted((d.id, d.updated) for d in links))
+
+    @classmethod
+    def load(cls):
+        volt_services = VOLTService.objects.all()
+        signature = cls.signature(volt_services)
+
+        with cls._lock:
+            if cls._services is not None and signature == cls._signature:
+                cls._checked_at = time.time()
+                return cls._services
+
+        services = {}
+        for service in volt_services:
+            try:
+                onos = Helpers.get_onos_service_name(service)
+            except Exception, e:
+                log.warning("Cannot find the ONOS service of the vOLTService", service=service.name, reason=e)
+                continue
+            services.setdefault(onos.lower(), []).append(service.id)
+
+        with cls._lock:
+            cls._services = services
+            cls._signature = signature
+            cls._checked_at = time.time()
+
+        return services
+
+    @classmethod
+    def lookup(cls, name):
+        """
+        :param name: string - the name of an ONOS service
+        :return: list - the ids of the vOLTServices using it
+        """
+        with cls._lock:
+            services = cls._services
+            if services is not None and time.time() - cls._checked_at > cls.ttl:
+                services = None
+
+        if services is None:
+            services = cls.load()
+
+        return services.get(name.lower(), [])
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._services = cls._signature = None
+            cls._checked_at = 0
+
+
 class KubernetesPodDetailsEventStep(EventStep):
     topics = ["xos.kubernetes.pod-details"]
     technology = "kafka"
@@ -46,14 +121,14 @@ class KubernetesPodDetailsEventStep(EventStep):
         if not xos_service:
             return
 
-        for service in VOLTService.objects.all():
-            onos = Helpers.get_onos_service_name(service)
-            # NOTE do we really need to dynamically fetch the ONOS name?
-            if (onos.lower() != xos_service.lower()):
-                continue
+        for service_id in OnosServiceIndex.lookup(xos_service):
+            for service in VOLTService.objects.filter(id=service_id):
+                # NOTE the subscribers are replayed to ONOS at a limited rate by SyncVOLTServiceInstance, the ones
+                # still waiting for a previous replay are not dirtied again
+                marked = 0
+                for service_instance in service.service_instances.all():
+                    if SubscriberReplay.mark(service_instance):
+                        log.debug("Dirtying VOLTServiceInstance", service_instance=service_instance)
+                        marked += 1
 
-            for service_instance in service.service_instances.all():
-                log.info("Dirtying VOLTServiceInstance", service_instance=service_instance)
-                service_instance.backend_code=0
-                service_instance.backend_status="resynchronize due to kubernetes event"
-                service_instance.save(update_fields=["updated", "backend_code", "backend_status"], always_update_timestamp=True)
+                SubscriberReplay.start(marked)
@@ -16,11 +16,16 @@
 
 import datetime
 import json
+import os
+import sys
 import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from xossynchronizer.event_steps.eventstep import EventStep
 from xosconfig import Config
 from xoskafka import XOSKafkaProducer
 from multistructlog import create_logger
+from olt_attachments import OLTAttachmentIndex
+from olt_subscribers import OLTSubscriberIndex
 
 log = create_logger(Config().get('logging'))
 
@@ -47,8 +52,12 @@ class OnosPortEventStep(EventStep):
 
         # Hypothetically, a maximum of 64 subscribers per pon port, 16 pon ports, and 32 characters
         # per subscriber name = 32KB of subscriber names in the event.
-        subscribers = self.subscriber_olt_closure(olt)
-        subscribers = [x.name for x in subscribers]
+        try:
+            subscribers = OLTSubscriberIndex.subscribers(olt.id)
+        except Exception, e:
+            log.exception("Failed to load the subscribers of the OLTs, walking the ones of this OLT", e=e)
+            subscribers = self.subscriber_olt_closure(olt)
+            subscribers = [x.name for x in subscribers]
 
         alarm = {"category": "OLT",
                  "reported_ts": time.time(),
@@ -78,6 +87,10 @@ class OnosPortEventStep(EventStep):
 
         value = json.loads(event.value)
 
+        if not OLTAttachmentIndex.is_attached(value["deviceId"], value["portId"]):
+            log.info("Onos port event not for a known olt", deviceId=value["deviceId"], portId=value["portId"])
+            return
+
         olt = self.model_accessor.OLTDevice.objects.filter(switch_datapath_id=value["deviceId"],
                                                            switch_port=value["portId"])
         if not olt:
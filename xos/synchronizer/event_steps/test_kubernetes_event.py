@@ -47,7 +47,18 @@ class TestKubernetesEvent(unittest.TestCase):
         from xossynchronizer.modelaccessor import model_accessor
         from mock_modelaccessor import MockObjectList
 
-        from kubernetes_event import KubernetesPodDetailsEventStep
+        import kubernetes_event
+        reload(kubernetes_event)  # so that it uses the models loaded above
+        from kubernetes_event import KubernetesPodDetailsEventStep, OnosServiceIndex
+
+        from helpers import Helpers
+        Helpers.clear_cache()
+
+        from subscriber_replay import SubscriberReplay
+        SubscriberReplay.clear()
+
+        OnosServiceIndex.clear()
+        self.index = OnosServiceIndex
 
         # import all class names to globals
         for (k, v) in model_accessor.all_model_classes.items():
@@ -114,6 +125,28 @@ class TestKubernetesEvent(unittest.TestCase):
                                        call(self.fcsi2, update_fields=["updated", "backend_code", "backend_status"],
                                             always_update_timestamp=True)])
 
+    def test_process_event_already_replaying(self):
+        self.fcsi1.backend_code = 0
+        self.fcsi1.backend_status = "resynchronize due to kubernetes event"
+
+        with patch.object(VOLTService.objects, "get_items") as fcservice_objects, \
+             patch.object(Service.objects, "get_items") as service_objects, \
+             patch.object(VOLTServiceInstance, "save", autospec=True) as fcsi_save:
+            fcservice_objects.return_value = [self.fcservice]
+            service_objects.return_value = [self.onos, self.fcservice]
+
+            event_dict = {"status": "created",
+                          "labels": {"xos_service": "myonos"}}
+            event = Mock()
+            event.value = json.dumps(event_dict)
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+            step.process_event(event)
+
+            # the subscriber still waiting to be replayed is not saved again
+            fcsi_save.assert_called_once_with(self.fcsi2, update_fields=["updated", "backend_code", "backend_status"],
+                                              always_update_timestamp=True)
+
     def test_process_event_unknownstatus(self):
         with patch.object(VOLTService.objects, "get_items") as fcservice_objects, \
              patch.object(Service.objects, "get_items") as service_objects, \
@@ -182,6 +215,53 @@ class TestKubernetesEvent(unittest.TestCase):
 
             fcsi_save.assert_not_called()
 
+    def test_process_event_index(self):
+        with patch.object(VOLTService.objects, "get_items") as fcservice_objects, \
+             patch.object(Service.objects, "get_items") as service_objects, \
+             patch.object(VOLTServiceInstance, "save", autospec=True) as fcsi_save, \
+             patch("helpers.Helpers.get_onos_service_name") as get_onos_service_name:
+            fcservice_objects.return_value = [self.fcservice]
+            service_objects.return_value = [self.onos, self.fcservice]
+            get_onos_service_name.return_value = "myonos"
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+
+            for name in ["something_else", "another_one", "MyOnos"]:
+                event = Mock()
+                event.value = json.dumps({"status": "created", "labels": {"xos_service": name}})
+                step.process_event(event)
+
+            # the ONOS services are resolved once, the events for other services are dropped without any query
+            get_onos_service_name.assert_called_once_with(self.fcservice)
+            self.assertEqual(fcservice_objects.call_count, 2)
+            self.assertEqual(fcsi_save.call_count, 2)
+
+    def test_index_ttl(self):
+        link = ServiceDependency(id=1113, subscriber_service_id=self.fcservice.id, provider_service_id=self.onos.id,
+                                 updated=1)
+
+        with patch.object(VOLTService.objects, "get_items") as fcservice_objects, \
+             patch.object(ServiceDependency.objects, "get_items") as link_objects, \
+             patch("helpers.Helpers.get_onos_service_name") as get_onos_service_name:
+            fcservice_objects.return_value = [self.fcservice]
+            link_objects.return_value = [link]
+            get_onos_service_name.return_value = "myonos"
+
+            self.assertEqual(self.index.lookup("myonos"), [self.fcservice.id])
+
+            # the links did not change, the index is not rebuilt
+            self.index._checked_at = 0
+            self.assertEqual(self.index.lookup("myonos"), [self.fcservice.id])
+            self.assertEqual(get_onos_service_name.call_count, 1)
+
+            # the vOLTService has been linked to another ONOS
+            link.updated = 2
+            get_onos_service_name.return_value = "otheronos"
+            self.index._checked_at = 0
+            self.assertEqual(self.index.lookup("myonos"), [])
+            self.assertEqual(self.index.lookup("otheronos"), [self.fcservice.id])
+            self.assertEqual(get_onos_service_name.call_count, 2)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -63,6 +63,17 @@ class TestOnosPortEvent(unittest.TestCase):
         import onos_event
         reload(onos_event)
 
+        import olt_attachments
+        reload(olt_attachments)  # so that it uses the models loaded above
+        from olt_attachments import OLTAttachmentIndex
+        self.attachments = OLTAttachmentIndex
+        self.attachments.clear()
+
+        import olt_subscribers
+        reload(olt_subscribers)  # so that it uses the models loaded above
+        from olt_subscribers import OLTSubscriberIndex
+        self.index = OLTSubscriberIndex
+
         from onos_event import OnosPortEventStep, XOSKafkaProducer
         from onos_event import XOSKafkaProducer
         self.XOSKafkaProducer = XOSKafkaProducer
@@ -79,16 +90,18 @@ class TestOnosPortEvent(unittest.TestCase):
                                         backend_status="succeeded")
 
         self.oltdevice = OLTDevice(name="myolt",
+                                   id=1,
                                    device_id="of:0000000000000001",
                                    switch_datapath_id="of:0000000000000001",
                                    switch_port="1")
 
-        self.ponport = PONPort(olt_device = self.oltdevice)
+        self.ponport = PONPort(id=2, olt_device = self.oltdevice, olt_device_id=1)
 
-        self.onudevice = ONUDevice(pon_port = self.ponport)
+        self.onudevice = ONUDevice(id=3, pon_port = self.ponport, pon_port_id=2)
 
-        self.subscriber = RCORDSubscriber(name="somesubscriber")
-        self.voltsi = VOLTServiceInstance()
+        self.subscriber = RCORDSubscriber(id=5, name="somesubscriber")
+        self.voltsi = VOLTServiceInstance(id=4, onu_device_id=3)
+        self.link = ServiceInstanceLink(provider_service_instance_id=4, subscriber_service_instance_id=5)
 
         # chain it all together
         self.oltdevice.pon_ports = MockObjectList([self.ponport])
@@ -96,9 +109,25 @@ class TestOnosPortEvent(unittest.TestCase):
         self.onudevice.volt_service_instances = MockObjectList([self.voltsi])
         self.voltsi.westbound_service_instances = [self.subscriber]
 
+        # the models the subscribers of the OLTs are loaded from
+        self.store_patchers = [patch.object(m.objects, "get_items", return_value=items) for (m, items) in [
+            (PONPort, [self.ponport]),
+            (ONUDevice, [self.onudevice]),
+            (VOLTServiceInstance, [self.voltsi]),
+            (ServiceInstance, [self.voltsi, self.subscriber]),
+            (ServiceInstanceLink, [self.link])]]
+        for patcher in self.store_patchers:
+            patcher.start()
+
+        OLTSubscriberIndex.clear()
+
         self.log = Mock()
 
     def tearDown(self):
+        for patcher in self.store_patchers:
+            patcher.stop()
+        self.index.clear()
+        self.attachments.clear()
         sys.path = self.sys_path_save
 
     def test_process_event_enable(self):
@@ -150,6 +179,24 @@ class TestOnosPortEvent(unittest.TestCase):
             # should not have changed
             self.assertEqual(self.oltdevice.link_status, None)
 
+    def test_process_event_not_attached(self):
+        with patch.object(OLTDevice.objects, "get_items") as olt_objects:
+            olt_objects.return_value = [self.oltdevice]
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+
+            for port in ["2", "3", "4"]:
+                event = Mock()
+                event.value = json.dumps({"timestamp": "2019-03-21T18:00:26.613Z",
+                                          "deviceId": self.oltdevice.switch_datapath_id,
+                                          "portId": port,
+                                          "enabled": False})
+                step.process_event(event)
+
+            # the OLTs are loaded once, the events for the other fabric ports are dropped without any query
+            self.assertEqual(olt_objects.call_count, 1)
+            self.assertEqual(self.oltdevice.link_status, None)
+
     def test_send_alarm(self):
         self.oltdevice.link_status = "down"
         value = {"timestamp":"2019-03-21T18:00:26.613Z",
@@ -236,6 +283,23 @@ class TestOnosPortEvent(unittest.TestCase):
 
         self.assertDictEqual(expected_alarm, event)
 
+    def test_send_alarm_index_fails(self):
+        self.oltdevice.link_status = "down"
+        value = {"timestamp":"2019-03-21T18:00:26.613Z",
+                 "deviceId":"of:0000000000000001",
+                 "portId":"2",
+                 "enabled":False}
+
+        with patch.object(PONPort.objects, "get_items") as pon_port_objects:
+            pon_port_objects.side_effect = Exception("boom")
+
+            step = self.event_step(model_accessor=self.model_accessor, log=self.log)
+            step.send_alarm(self.oltdevice, value)
+
+        # the subscribers are found walking the models of the OLT
+        event = json.loads(self.XOSKafkaProducer.produce.call_args[0][2])
+        self.assertEqual(event["context"]["affected_subscribers"], ["somesubscriber"])
+
 
 if __name__ == '__main__':
     unittest.main()
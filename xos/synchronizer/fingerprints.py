@@ -0,0 +1,63 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import threading
+
+
+class FingerprintCache(object):
+    """
+    Fingerprints of the VOLTHA data last applied to the XOS models by the pull steps, kept across the pull cycles.
+
+    A fingerprint is a hash of the VOLTHA fields a pull step maps on a model, plus anything else the result depends on
+    (ie: the model's updated timestamp, so that changes made in XOS are reconciled). When the fingerprint of a model is
+    the same as in the previous cycle there is nothing to update, and the pull step skips the model entirely.
+
+    Fingerprints are keyed by a kind (a string chosen by the pull step) and the id of the model, models that have not
+    been saved yet are never considered unchanged.
+    """
+
+    _lock = threading.Lock()
+    _fingerprints = {}
+
+    @staticmethod
+    def fingerprint(*values):
+        return hashlib.sha1(json.dumps(values, sort_keys=True, default=str)).hexdigest()
+
+    @classmethod
+    def unchanged(cls, kind, model, fingerprint):
+        if not model.id:
+            return False
+
+        with cls._lock:
+            return cls._fingerprints.get((kind, model.id)) == fingerprint
+
+    @classmethod
+    def update(cls, kind, model, fingerprint):
+        if not model.id:
+            return
+
+        with cls._lock:
+            cls._fingerprints[(kind, model.id)] = fingerprint
+
+    @classmethod
+    def forget(cls, kind, model):
+        with cls._lock:
+            cls._fingerprints.pop((kind, model.id), None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._fingerprints = {}
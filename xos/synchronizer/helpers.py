@@ -12,7 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
+
+
 class Helpers():
+    # the VOLTHA and ONOS information of a vOLTService is cached until the vOLTService is updated. Changes to the ONOS
+    # service do not update the vOLTService, so the cached information is also reloaded after cache_ttl seconds.
+    cache_ttl = 60
+
+    _cache_lock = threading.Lock()
+    _cache = {}
+
+    @staticmethod
+    def cached(olt_service, name, load):
+        """
+        Return load(olt_service), cached per vOLTService.
+        :param name: string - what is cached
+        :param load: function - loads the value from olt_service
+        """
+        if not olt_service.id:
+            return load(olt_service)
+
+        key = (olt_service.id, name)
+
+        with Helpers._cache_lock:
+            (updated, loaded_at, value) = Helpers._cache.get(key, (None, 0, None))
+
+        if updated != olt_service.updated or time.time() - loaded_at > Helpers.cache_ttl:
+            value = load(olt_service)
+            with Helpers._cache_lock:
+                Helpers._cache[key] = (olt_service.updated, time.time(), value)
+
+        return value
+
+    @staticmethod
+    def clear_cache():
+        with Helpers._cache_lock:
+            Helpers._cache = {}
+
     @staticmethod
     def format_url(url):
         if 'http' in url:
@@ -22,15 +60,26 @@ class Helpers():
 
     @staticmethod
     def get_voltha_info(olt_service):
+        return dict(Helpers.cached(olt_service, "voltha_info", lambda s: {
+            'url': Helpers.format_url(s.voltha_url),
+            'port': s.voltha_port,
+            'user': s.voltha_user,
+            'pass': s.voltha_pass
+        }))
+
+    @staticmethod
+    def get_etcd_info(olt_service):
         return {
-            'url': Helpers.format_url(olt_service.voltha_url),
-            'port': olt_service.voltha_port,
-            'user': olt_service.voltha_user,
-            'pass': olt_service.voltha_pass
+            'url': olt_service.etcd_url,
+            'port': olt_service.etcd_port
         }
 
     @staticmethod
     def get_onos(olt_service):
+        return Helpers.cached(olt_service, "onos", Helpers.find_onos)
+
+    @staticmethod
+    def find_onos(olt_service):
         # get the onos service
         onos = [s.leaf_model for s in olt_service.provider_services if "onos" in s.name.lower()]
 
@@ -50,12 +99,12 @@ class Helpers():
 
         onos = Helpers.get_onos(olt_service)
 
-        return {
+        return dict(Helpers.cached(olt_service, "onos_voltha_info", lambda s: {
             'url': Helpers.format_url(onos.rest_hostname),
             'port': onos.rest_port,
             'user': onos.rest_username,
             'pass': onos.rest_password
-        }
+        }))
 
     @staticmethod
     def datapath_id_to_hex(id):
@@ -0,0 +1,39 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.21 on 2026-10-18 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('volt', '0012_oltdevice_decl_activation_started'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voltservice_decl',
+            name='etcd_port',
+            field=models.IntegerField(default=2379, help_text=b'The port of the ETCD used by Voltha. By default 2379'),
+        ),
+        migrations.AddField(
+            model_name='voltservice_decl',
+            name='etcd_url',
+            field=models.CharField(default=b'etcd-cluster.default.svc.cluster.local', help_text=b'The address of the ETCD used by Voltha. By default etcd-cluster.default.svc.cluster.local', max_length=254),
+        ),
+    ]
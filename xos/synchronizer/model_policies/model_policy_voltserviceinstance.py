@@ -17,6 +17,11 @@
 from xossynchronizer.modelaccessor import VOLTServiceInstance, ServiceInstanceLink, ONUDevice, ServiceInstance, model_accessor
 from xossynchronizer.model_policies.policy import Policy
 
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from olt_subscribers import OLTSubscriberIndex
+
 class VOLTServiceInstancePolicy(Policy):
     model_name = "VOLTServiceInstance"
 
@@ -36,7 +41,7 @@ class VOLTServiceInstancePolicy(Policy):
         self.associate_onu_device(si)
 
     def handle_delete(self, si):
-        pass
+        OLTSubscriberIndex.remove(si.id)
 
     def create_eastbound_instance(self, si):
         links = si.owner.subscribed_dependencies.all()
@@ -69,3 +74,9 @@ class VOLTServiceInstancePolicy(Policy):
 
         si.onu_device_id = onu.id
         si.save_changed_fields()
+
+        # keep the subscribers affected by a LOS of the OLT up to date. Until the index is loaded there is nothing to
+        # update, the subscriber will be found in XOS when it is
+        if OLTSubscriberIndex.is_loaded():
+            OLTSubscriberIndex.update(si.id, onu.id, onu.pon_port.olt_device_id,
+                                      [x.name for x in base_si.westbound_service_instances])
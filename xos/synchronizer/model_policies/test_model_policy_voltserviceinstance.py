@@ -23,7 +23,7 @@ test_path=os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
 
 class TestModelPolicyVOLTServiceInstance(unittest.TestCase):
     def setUp(self):
-        global VOLTServiceInstancePolicy, MockObjectList
+        global VOLTServiceInstancePolicy, MockObjectList, OLTSubscriberIndex
 
         self.sys_path_save = sys.path
 
@@ -45,7 +45,7 @@ class TestModelPolicyVOLTServiceInstance(unittest.TestCase):
         self.model_accessor = model_accessor
 
         from mock_modelaccessor import MockObjectList
-        from model_policy_voltserviceinstance import VOLTServiceInstancePolicy
+        from model_policy_voltserviceinstance import VOLTServiceInstancePolicy, OLTSubscriberIndex
 
         # import all class names to globals
         for (k, v) in model_accessor.all_model_classes.items():
@@ -115,14 +115,19 @@ class TestModelPolicyVOLTServiceInstance(unittest.TestCase):
 
     def test_associate_onu(self):
         with patch.object(ServiceInstance.objects, "get") as get_si, \
-             patch.object(ONUDevice.objects, "get") as get_onu:
+             patch.object(ONUDevice.objects, "get") as get_onu, \
+             patch.object(OLTSubscriberIndex, "is_loaded", return_value=True), \
+             patch.object(OLTSubscriberIndex, "update") as update:
 
             mock_si = Mock()
             mock_si.get_westbound_service_instance_properties.return_value = "BRCM1234"
+            mock_si.westbound_service_instances = [Mock()]
+            mock_si.westbound_service_instances[0].name = "somesubscriber"
             get_si.return_value = mock_si
 
             mock_onu = Mock()
             mock_onu.id = 12
+            mock_onu.pon_port.olt_device_id = 11
             get_onu.return_value = mock_onu
 
             self.policy.associate_onu_device(self.si)
@@ -130,9 +135,41 @@ class TestModelPolicyVOLTServiceInstance(unittest.TestCase):
             self.assertEqual(self.si.onu_device_id, mock_onu.id)
             self.si.save_changed_fields.assert_called()
 
+            update.assert_called_with(self.si.id, 12, 11, ["somesubscriber"])
+
+    def test_associate_onu_index_not_loaded(self):
+        import model_policy_voltserviceinstance
+
+        with patch.object(model_policy_voltserviceinstance.ServiceInstance.objects, "get") as get_si, \
+             patch.object(model_policy_voltserviceinstance.ONUDevice.objects, "get") as get_onu, \
+             patch.object(OLTSubscriberIndex, "is_loaded", return_value=False), \
+             patch.object(OLTSubscriberIndex, "update") as update:
+
+            mock_si = Mock()
+            mock_si.get_westbound_service_instance_properties.return_value = "BRCM1234"
+            type(mock_si).westbound_service_instances = PropertyMock()
+            get_si.return_value = mock_si
+
+            mock_onu = Mock()
+            mock_onu.id = 12
+            type(mock_onu).pon_port = PropertyMock()
+            get_onu.return_value = mock_onu
+
+            self.policy.associate_onu_device(self.si)
+
+            self.assertEqual(self.si.onu_device_id, mock_onu.id)
+
+            # the OLT and the subscribers are not looked up when the index is not loaded
+            update.assert_not_called()
+            type(mock_onu).pon_port.assert_not_called()
+            type(mock_si).westbound_service_instances.assert_not_called()
+
     def test_handle_delete(self):
-        self.policy.handle_delete(self.si)
-        # handle delete does nothing, and should trivially succeed
+        with patch.object(OLTSubscriberIndex, "remove") as remove:
+            self.policy.handle_delete(self.si)
+
+            # the subscribers are not affected by a LOS of the OLT anymore
+            remove.assert_called_with(self.si.id)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,105 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xossynchronizer.modelaccessor import OLTDevice
+
+
+class OLTAttachmentIndex(object):
+    """
+    The fabric ports (switch_datapath_id, switch_port) the OLTs are attached to.
+
+    Most of the ONOS port events are for fabric ports with no OLT behind them, the index lets them be dropped without
+    querying XOS. It is loaded with a single query, reloaded after ttl seconds, and updated by SyncOLTDevice with the
+    OLTDevices that changed, so that a new attachment is known in the next sync cycle.
+    """
+
+    # the index is reloaded from XOS after this many seconds
+    ttl = 300
+
+    _lock = threading.Lock()
+    _olts = None  # OLTDevice id -> (switch_datapath_id, switch_port)
+    _ports = {}  # (switch_datapath_id, switch_port) -> ids of the OLTDevices attached to it
+    _loaded_at = 0
+
+    @staticmethod
+    def key(switch_datapath_id, switch_port):
+        if not switch_datapath_id or switch_port in (None, ""):
+            return None
+        return (str(switch_datapath_id), str(switch_port))
+
+    @classmethod
+    def _set(cls, olt_id, key):
+        previous = cls._olts.pop(olt_id, None)
+        if previous is not None:
+            cls._ports[previous].discard(olt_id)
+            if not cls._ports[previous]:
+                del cls._ports[previous]
+
+        if key is not None:
+            cls._olts[olt_id] = key
+            cls._ports.setdefault(key, set()).add(olt_id)
+
+    @classmethod
+    def load(cls):
+        olts = OLTDevice.objects.all()
+
+        with cls._lock:
+            cls._olts = {}
+            cls._ports = {}
+            for olt in olts:
+                cls._set(olt.id, cls.key(olt.switch_datapath_id, olt.switch_port))
+            cls._loaded_at = time.time()
+
+    @classmethod
+    def update(cls, olts, deleted=False):
+        """
+        Record the attachments of the OLTDevices that changed.
+        :param deleted: whether the OLTDevices have been deleted
+        """
+        with cls._lock:
+            # if the index is not loaded yet, the OLTs will be found in XOS when it is
+            if cls._olts is None:
+                return
+
+            for olt in olts:
+                if olt.id:
+                    cls._set(olt.id, None if deleted else cls.key(olt.switch_datapath_id, olt.switch_port))
+
+    @classmethod
+    def is_attached(cls, switch_datapath_id, switch_port):
+        """
+        :return: bool - whether an OLT is attached to the fabric port
+        """
+        key = cls.key(switch_datapath_id, switch_port)
+        if key is None:
+            return False
+
+        with cls._lock:
+            loaded = cls._olts is not None and time.time() - cls._loaded_at <= cls.ttl
+
+        if not loaded:
+            cls.load()
+
+        with cls._lock:
+            return key in cls._ports
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._olts = None
+            cls._ports = {}
+            cls._loaded_at = 0
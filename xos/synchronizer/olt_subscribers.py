@@ -0,0 +1,148 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xossynchronizer.modelaccessor import ONUDevice, PONPort, ServiceInstance, ServiceInstanceLink, \
+    VOLTServiceInstance
+
+
+class OLTSubscriberIndex(object):
+    """
+    The names of the subscribers of every OLT, ie: the ones affected by a LOS of the OLT.
+
+    The index is loaded from XOS with a few bulk queries the first time it is needed, and reloaded after ttl seconds.
+    In between it is kept up to date by the VOLTServiceInstance model policy, that attaches the subscribers to their
+    ONU, and by the ONU pull step, that finds the ONUs moving to another OLT.
+    """
+
+    # the index is reloaded from XOS after this many seconds
+    ttl = 600
+
+    _lock = threading.Lock()
+    _olts = None  # OLTDevice id -> ids of its ONUDevices
+    _onus = {}  # ONUDevice id -> OLTDevice id
+    _subscribers = {}  # ONUDevice id -> VOLTServiceInstance id -> subscriber names
+    _service_instances = {}  # VOLTServiceInstance id -> ONUDevice id
+    _loaded_at = 0
+
+    @classmethod
+    def load(cls):
+        olt_of_pon_port = dict((p.id, p.olt_device_id) for p in PONPort.objects.all())
+        onus = dict((o.id, olt_of_pon_port.get(o.pon_port_id)) for o in ONUDevice.objects.all())
+
+        names = dict((si.id, si.name) for si in ServiceInstance.objects.all())
+        westbound = {}
+        for link in ServiceInstanceLink.objects.all():
+            if link.subscriber_service_instance_id:
+                westbound.setdefault(link.provider_service_instance_id, []).append(link.subscriber_service_instance_id)
+
+        with cls._lock:
+            cls._olts = {}
+            cls._onus = {}
+            cls._subscribers = {}
+            cls._service_instances = {}
+
+            for (onu_id, olt_id) in onus.items():
+                cls._set_onu(onu_id, olt_id)
+
+            for si in VOLTServiceInstance.objects.all():
+                if si.onu_device_id:
+                    cls._set_subscribers(si.id, si.onu_device_id,
+                                         [names[i] for i in westbound.get(si.id, []) if i in names])
+
+            cls._loaded_at = time.time()
+
+    @classmethod
+    def _set_onu(cls, onu_id, olt_id):
+        previous = cls._onus.get(onu_id)
+        if previous is not None:
+            cls._olts[previous].discard(onu_id)
+
+        cls._onus[onu_id] = olt_id
+        if olt_id is not None:
+            cls._olts.setdefault(olt_id, set()).add(onu_id)
+
+    @classmethod
+    def _set_subscribers(cls, si_id, onu_id, names):
+        cls._remove(si_id)
+        cls._service_instances[si_id] = onu_id
+        cls._subscribers.setdefault(onu_id, {})[si_id] = names
+
+    @classmethod
+    def _remove(cls, si_id):
+        onu_id = cls._service_instances.pop(si_id, None)
+        if onu_id is not None:
+            cls._subscribers[onu_id].pop(si_id, None)
+
+    @classmethod
+    def is_loaded(cls):
+        """
+        :return: bool - whether the index is loaded, ie: whether it has to be kept up to date
+        """
+        with cls._lock:
+            return cls._olts is not None
+
+    @classmethod
+    def set_onu(cls, onu_id, olt_id):
+        with cls._lock:
+            # if the index is not loaded yet, the ONU will be found in XOS when it is
+            if cls._olts is not None:
+                cls._set_onu(onu_id, olt_id)
+
+    @classmethod
+    def update(cls, si_id, onu_id, olt_id, names):
+        """
+        Record the subscribers of a VOLTServiceInstance.
+        :param names: list - the names of its westbound service instances
+        """
+        with cls._lock:
+            if cls._olts is not None:
+                cls._set_onu(onu_id, olt_id)
+                cls._set_subscribers(si_id, onu_id, names)
+
+    @classmethod
+    def remove(cls, si_id):
+        with cls._lock:
+            if cls._olts is not None:
+                cls._remove(si_id)
+
+    @classmethod
+    def subscribers(cls, olt_id):
+        """
+        :return: list - the names of the subscribers of the OLT
+        """
+        with cls._lock:
+            loaded = cls._olts is not None and time.time() - cls._loaded_at <= cls.ttl
+
+        if not loaded:
+            cls.load()
+
+        with cls._lock:
+            names = []
+            for onu_id in sorted(cls._olts.get(olt_id, [])):
+                subscribers = cls._subscribers.get(onu_id, {})
+                for si_id in sorted(subscribers):
+                    names.extend(subscribers[si_id])
+            return names
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._olts = None
+            cls._onus = {}
+            cls._subscribers = {}
+            cls._service_instances = {}
+            cls._loaded_at = 0
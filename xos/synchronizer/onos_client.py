@@ -0,0 +1,127 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from helpers import Helpers
+
+
+class OnosClient(object):
+    """
+    A client for the REST API of onos-voltha.
+
+    As for VolthaClient, a client is created once per ONOS endpoint and shared by all the steps (and threads) talking
+    to it, requests go through a pooled requests.Session.
+
+    Every method returns the requests.Response, it's up to the caller to check the status code. Connection errors are
+    raised as usual.
+    """
+
+    # maximum number of connections kept open towards an ONOS
+    pool_size = 16
+
+    # default timeout (in seconds) of a request, every method accepts a timeout to override it
+    timeout = 10
+
+    _lock = threading.Lock()
+    _clients = {}
+
+    def __init__(self, url, port, user, password):
+        self.base_url = "%s:%s/onos" % (url, port)
+
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(user, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def for_service(cls, volt_service):
+        """
+        Return the client for the ONOS used by volt_service.
+        :param volt_service: VOLTService
+        :return: OnosClient
+        """
+        onos = Helpers.get_onos_voltha_info(volt_service)
+        key = (onos['url'], onos['port'], onos['user'], onos['pass'])
+
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = cls(*key)
+            return cls._clients[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._clients = {}
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return self.timeout
+        return timeout
+
+    def add_subscriber(self, handle, timeout=None):
+        """
+        :param handle: string - <dp_id>/<uni port number>
+        """
+        return self.session.post(self.base_url + "/olt/oltapp/%s" % handle, timeout=self._timeout(timeout))
+
+    def remove_subscriber(self, handle, timeout=None):
+        """
+        :param handle: string - <dp_id>/<uni port number>
+        """
+        return self.session.delete(self.base_url + "/olt/oltapp/%s" % handle, timeout=self._timeout(timeout))
+
+    def get_network_configuration(self, subject, timeout=None):
+        """
+        :param subject: string - the subject class of the configuration, ie: "devices"
+        """
+        return self.session.get(self.base_url + "/v1/network/configuration/%s" % subject,
+                                timeout=self._timeout(timeout))
+
+    def push_network_configuration(self, data, timeout=None):
+        """
+        :param data: dict - the configuration, by subject class
+        """
+        return self.session.post(self.base_url + "/v1/network/configuration/", json=data,
+                                 timeout=self._timeout(timeout))
+
+    def programmed_subscribers(self, timeout=None):
+        """
+        Read the subscribers programmed in the OLT app, see parse_programmed_subscribers for the response.
+        """
+        return self.session.get(self.base_url + "/olt/oltapp/programmed-subscribers", timeout=self._timeout(timeout))
+
+    @staticmethod
+    def parse_programmed_subscribers(data):
+        """
+        Return the handles (<dp_id>/<uni port number>) of the subscribers programmed in the OLT app.
+        :param data: the decoded programmed-subscribers response of the OLT app, that lists the connect point of every
+                     subscriber as its location: {"entries": [{"location": "of:0000000000000001/16", "tagInfo": ...}]}
+        :raise ValueError: if the response has any other format
+        """
+        try:
+            handles = set(entry["location"] for entry in data["entries"])
+        except (TypeError, KeyError), e:
+            raise ValueError("unexpected programmed subscribers: %s" % e)
+
+        for handle in handles:
+            if not isinstance(handle, basestring) or "/" not in handle:
+                raise ValueError("unexpected programmed subscriber location: %s" % handle)
+
+        return handles
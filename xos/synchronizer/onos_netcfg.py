@@ -0,0 +1,123 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import requests
+from multistructlog import create_logger
+from xosconfig import Config
+
+log = create_logger(Config().get('logging'))
+
+
+class OnosNetworkConfig(object):
+    """
+    The devices section of the ONOS network configuration, as last read from (or pushed to) each ONOS.
+
+    Pushing a network configuration makes ONOS recompute its state, even if nothing changed. SyncOLTDevice reads the
+    devices configuration at most once per cycle and only pushes the entries that differ from what ONOS already has.
+    When the configuration of an ONOS is unknown (never read, or the read failed) every entry is pushed.
+
+    The requests go through the OnosClient of each ONOS, which is also the key of its configuration.
+    """
+
+    # timeout (in seconds) of the requests to ONOS
+    timeout = 5
+
+    _lock = threading.Lock()
+    _devices = {}  # OnosClient -> device id -> configuration
+
+    @staticmethod
+    def includes(current, desired):
+        """
+        Whether the configuration desired is already part of the configuration current.
+        """
+        if isinstance(desired, dict):
+            return isinstance(current, dict) and \
+                   all(k in current and OnosNetworkConfig.includes(current[k], v) for (k, v) in desired.items())
+        return current == desired
+
+    @classmethod
+    def refresh(cls, onos):
+        """
+        Read the devices configuration from ONOS.
+        :param onos: OnosClient
+        :return: dict - device id -> configuration, or None if it could not be read
+        """
+        url = onos.base_url + "/v1/network/configuration/devices"
+
+        devices = None
+        try:
+            request = onos.get_network_configuration("devices", timeout=cls.timeout)
+
+            if request.status_code == 200:
+                devices = request.json()
+            else:
+                log.warn("It was not possible to read the devices configuration from ONOS", url=url,
+                         status_code=request.status_code, response=request.text)
+        except (requests.exceptions.RequestException, ValueError), e:
+            log.warn("It was not possible to read the devices configuration from ONOS", url=url, reason=e)
+
+        with cls._lock:
+            cls._devices[onos] = devices
+
+        return devices
+
+    @classmethod
+    def changes(cls, onos, devices):
+        """
+        Return the entries of devices that ONOS does not have yet.
+        :param onos: OnosClient
+        :param devices: dict - device id -> configuration
+        :return: dict - device id -> configuration
+        """
+        with cls._lock:
+            current = cls._devices.get(onos)
+
+        if current is None:
+            return dict(devices)
+
+        return dict((d, c) for (d, c) in devices.items() if not cls.includes(current.get(d), c))
+
+    @classmethod
+    def push(cls, onos, devices):
+        """
+        Push the configuration of devices to ONOS with a single request, the entries are recorded as configured if ONOS
+        accepts them.
+        :param onos: OnosClient
+        :param devices: dict - device id -> configuration
+        :return: the ONOS response
+        """
+        data = {
+            "devices": devices
+        }
+
+        log.info("Calling ONOS", data=data)
+
+        request = onos.push_network_configuration(data, timeout=cls.timeout)
+
+        if request.status_code == 200:
+            with cls._lock:
+                current = cls._devices.get(onos)
+                if current is not None:
+                    for (device_id, config) in devices.items():
+                        # ONOS replaces each configuration (ie: "basic") of a device as a whole
+                        current[device_id] = dict(current.get(device_id, {}), **config)
+
+        return request
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._devices = {}
@@ -18,37 +18,34 @@ from xossynchronizer.modelaccessor import model_accessor, OLTDevice, VOLTService
 from xosconfig import Config
 from multistructlog import create_logger
 
-import requests
 from requests import ConnectionError
 from requests.models import InvalidURL
+from multiprocessing.pool import ThreadPool
 
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers import Helpers
+from voltha_client import VolthaClient  # noqa: E402
+from voltha_inventory import DeviceSnapshot, LogicalDeviceIndex  # noqa: E402
+from fingerprints import FingerprintCache  # noqa: E402
 
 log = create_logger(Config().get('logging'))
 
 class OLTDevicePullStep(PullStep):
+
+    # maximum number of OLTs whose ports are being fetched from VOLTHA at the same time
+    max_concurrent_port_fetches = 16
+
     def __init__(self, model_accessor):
         super(OLTDevicePullStep, self).__init__(model_accessor=model_accessor, observed_model=OLTDevice)
 
     @staticmethod
     def get_ids_from_logical_device(o):
-        voltha_url = Helpers.get_voltha_info(o.volt_service)['url']
-        voltha_port = Helpers.get_voltha_info(o.volt_service)['port']
-
-        r = requests.get("%s:%s/api/v1/logical_devices" % (voltha_url, voltha_port), timeout=1)
+        logical_device = LogicalDeviceIndex.lookup(o.volt_service, o.device_id)
 
-        if r.status_code != 200:
-            raise Exception("Failed to retrieve logical devices from VOLTHA: %s" % r.text)
-
-        res = r.json()
-
-        for ld in res["items"]:
-            if ld["root_device_id"] == o.device_id:
-                o.of_id = ld["id"]
-                o.dp_id = "of:" + Helpers.datapath_id_to_hex(ld["datapath_id"])  # convert to hex
+        if logical_device:
+            o.of_id = logical_device["of_id"]
+            o.dp_id = logical_device["dp_id"]
 
         # Note: If the device is administratively disabled, then it's likely we won't find a logical device for
         # it. Only throw the exception for OLTs that are enabled.
@@ -65,27 +62,24 @@ class OLTDevicePullStep(PullStep):
             log.warn('VOLTService not found')
             return
 
-        voltha_url = Helpers.get_voltha_info(self.volt_service)['url']
-        voltha_port = Helpers.get_voltha_info(self.volt_service)['port']
-
         try:
-            r = requests.get("%s:%s/api/v1/devices" % (voltha_url, voltha_port), timeout=1)
+            snapshot = DeviceSnapshot.get(self.volt_service, consumer=self.__class__.__name__)
 
-            if r.status_code != 200:
-                log.debug("[OLT pull step] It was not possible to fetch devices from VOLTHA")
-
-            # [SEBA-367] Handling blank response received from Voltha, Scenario occurs when voltha api is called while vcore service is re-starting
-            elif r.text:
+            if snapshot:
                 # keeping only OLTs
-                devices = [d for d in r.json()["items"] if "olt" in d["type"]]
+                devices = list(snapshot.olts)
 
                 log.debug("[OLT pull step] received devices", olts=devices)
 
+                # rebuild the logical device index once per cycle, get_ids_from_logical_device will use it
+                if devices:
+                    LogicalDeviceIndex.refresh(self.volt_service)
+
+                self.load_olts()
+
                 olts_in_voltha = self.create_or_update_olts(devices)
 
                 self.delete_olts(olts_in_voltha)
-            else:
-                log.debug("[OLT pull step] Blank response received")
 
         except (ValueError, TypeError), e:
             log.warn("[OLT pull step] Invalid Json received in response from VOLTHA", reason=e)
@@ -97,11 +91,33 @@ class OLTDevicePullStep(PullStep):
             log.warn("[OLT pull step] VOLTHA url is invalid, is it configured in the VOLTService?", reason=e)
             return
 
+    def load_olts(self):
+        """
+        Load the OLTDevices of the VOLTService with a single query, and index them by the keys used to match them
+        with the VOLTHA devices.
+        """
+        self.olts = OLTDevice.objects.filter(volt_service_id=self.volt_service.id)
+
+        self.olts_by_host_and_port = {}
+        self.olts_by_mac_address = {}
+        self.olts_by_device_id = {}
+
+        for model in self.olts:
+            if model.host and model.port:
+                self.olts_by_host_and_port[(model.device_type, model.host, str(model.port))] = model
+            if model.mac_address:
+                self.olts_by_mac_address[(model.device_type, model.mac_address)] = model
+            if model.device_id:
+                self.olts_by_device_id[model.device_id] = model
+
     def create_or_update_olts(self, olts):
 
         updated_olts = []
 
-        for olt in olts:
+        # fetching the ports is the slow part, do it upfront for all the OLTs and apply the updates in order
+        all_olt_ports = self.fetch_all_olt_ports(olts)
+
+        for (olt, olt_ports) in zip(olts, all_olt_ports):
             if olt["type"] == "simulated_olt":
                 [host, port] = ["172.17.0.1", "50060"]
             elif "host_and_port" in olt:
@@ -109,14 +125,12 @@ class OLTDevicePullStep(PullStep):
             elif "mac_address" in olt:
                 mac_address = olt["mac_address"]
 
-            olt_ports = self.fetch_olt_ports(olt["id"])
-
             try:
                 if "host_and_port" in olt:
-                    model = OLTDevice.objects.filter(device_type=olt["type"], host=host, port=port)[0]
+                    model = self.olts_by_host_and_port[(olt["type"], host, str(port))]
                     log.debug("[OLT pull step] OLTDevice already exists, updating it", device_type=olt["type"], id=model.id, host=host, port=port)
                 elif "mac_address" in olt:
-                    model = OLTDevice.objects.filter(device_type=olt["type"], mac_address=mac_address)[0]
+                    model = self.olts_by_mac_address[(olt["type"], mac_address)]
                     log.debug("[OLT pull step] OLTDevice already exists, updating it", device_type=olt["type"], id=model.id, mac_address=mac_address)
 
                 if model.enacted < model.updated:
@@ -127,7 +141,7 @@ class OLTDevicePullStep(PullStep):
                     updated_olts.append(model)
                     continue
 
-            except IndexError:
+            except KeyError:
 
                 model = OLTDevice()
                 model.device_type = olt["type"]
@@ -162,6 +176,19 @@ class OLTDevicePullStep(PullStep):
                 # Initial admin_state
                 model.admin_state = olt["admin_state"]
 
+            # nothing to do if what VOLTHA reports has not changed since the last time the OLT was updated. The logical
+            # device is taken from the index rebuilt by pull_records, an OLT that has none is not refreshed for this
+            fingerprint = FingerprintCache.fingerprint(olt["id"], olt["oper_status"], olt["serial_number"],
+                                                       LogicalDeviceIndex.cached(self.volt_service, olt["id"]),
+                                                       self.volt_service.id, model.updated)
+            if FingerprintCache.unchanged("OLTDevice", model, fingerprint):
+                log.debug("[OLT pull step] OLTDevice is unchanged in VOLTHA, skipping it", name=model.name,
+                          id=model.id)
+                if olt_ports:
+                    self.create_or_update_ports(olt_ports, model)
+                updated_olts.append(model)
+                continue
+
             # Check to see if Voltha's serial_number field is populated. During Activation it's possible that
             # Voltha's serial_number field may be blank. We want to avoid overwriting a populated data model
             # serial number with an unpopulated Voltha serial number. IF this happened, then there would be
@@ -201,6 +228,10 @@ class OLTDevicePullStep(PullStep):
             model.device_id = olt["id"]
             model.oper_status = olt["oper_status"]
 
+            if model.oper_status == "ACTIVE":
+                # the activation is over, a new one will enable the device again
+                model.activation_started = None
+
             model.volt_service = self.volt_service
             model.volt_service_id = self.volt_service.id
 
@@ -209,6 +240,8 @@ class OLTDevicePullStep(PullStep):
 
             model.save_changed_fields()
 
+            FingerprintCache.update("OLTDevice", model, fingerprint)
+
             if olt_ports:
                 self.create_or_update_ports(olt_ports, model)
 
@@ -216,17 +249,31 @@ class OLTDevicePullStep(PullStep):
 
         return updated_olts
 
+    def fetch_all_olt_ports(self, olts):
+        """ Query voltha for the ports of all the given OLTs, with at most max_concurrent_port_fetches requests
+            in flight.
+
+            Returns a list containing the result of fetch_olt_ports for each OLT, in the same order as olts.
+        """
+
+        if not olts:
+            return []
+
+        pool = ThreadPool(min(self.max_concurrent_port_fetches, len(olts)))
+        try:
+            return pool.map(self.fetch_olt_ports, [olt["id"] for olt in olts])
+        finally:
+            pool.close()
+            pool.join()
+
     def fetch_olt_ports(self, olt_device_id):
         """ Given an olt device_id, query voltha for the set of ports associated with that OLT.
 
             Returns a list of port dictionaries, or None in case of error.
         """
 
-        voltha_url = Helpers.get_voltha_info(self.volt_service)['url']
-        voltha_port = Helpers.get_voltha_info(self.volt_service)['port']
-
         try:
-            r = requests.get("%s:%s/api/v1/devices/%s/ports" % (voltha_url, voltha_port, olt_device_id), timeout=1)
+            r = VolthaClient.for_service(self.volt_service).device_ports(olt_device_id, timeout=1)
 
             if r.status_code != 200:
                 log.warn("[OLT pull step] It was not possible to fetch ports from VOLTHA for device %s" % olt_device_id,
@@ -249,12 +296,20 @@ class OLTDevicePullStep(PullStep):
         return None
 
     def create_or_update_ports(self, ports, olt):
+        # nothing to do if the ports VOLTHA reports have not changed since the last time they were updated
+        fingerprint = FingerprintCache.fingerprint(
+            olt.device_id, [(p["port_no"], p["label"], p["type"], p["admin_state"], p["oper_status"]) for p in ports])
+        if FingerprintCache.unchanged("OLTDevice.ports", olt, fingerprint):
+            return
+
         nni_ports = [p for p in ports if "ETHERNET_NNI" in p["type"]]
         pon_ports = [p for p in ports if "PON_OLT" in p["type"]]
 
         self.create_or_update_nni_port(nni_ports, olt)
         self.create_or_update_pon_port(pon_ports, olt)
 
+        FingerprintCache.update("OLTDevice.ports", olt, fingerprint)
+
     def create_or_update_pon_port(self, pon_ports, olt):
 
         update_ports = []
@@ -299,20 +354,55 @@ class OLTDevicePullStep(PullStep):
         return update_ports
 
     def delete_olts(self, olts_in_voltha):
+        """
+        Delete the OLTDevices loaded at the beginning of the cycle that are not present in VOLTHA anymore.
+        OLTDevices that are being synchronized (enacted < updated) are kept.
+        """
 
-        olts_id_in_voltha = [m.device_id for m in olts_in_voltha]
-
-        xos_olts = OLTDevice.objects.all()
+        ids_in_voltha = set(m.device_id for m in olts_in_voltha)
 
-        deleted_in_voltha = [o for o in xos_olts if o.device_id not in olts_id_in_voltha]
+        # NOTE the device_id of the models may have been set during this cycle, so the index built when loading them
+        # can't be used here. OLTDevices without a device_id have never been found in VOLTHA.
+        missing = [m for m in self.olts if m.device_id not in ids_in_voltha]
 
-        for model in deleted_in_voltha:
+        kept = []
+        deleted_in_voltha = []
 
+        for model in missing:
             if model.enacted < model.updated:
                 # DO NOT delete a model that is being processed
-                log.debug("[OLT pull step] device is not present in VOLTHA, skipping deletion as sync is in progress", device_id=o.device_id,
-                          name=o.name)
-                continue
+                log.debug("[OLT pull step] device is not present in VOLTHA, skipping deletion as sync is in progress",
+                          device_id=model.device_id, name=model.name)
+                kept.append(model)
+            else:
+                deleted_in_voltha.append(model)
+
+        deleted = self.delete_models(deleted_in_voltha)
 
-            log.debug("[OLT pull step] deleting device as it's not present in VOLTHA", device_id=o.device_id, name=o.name, id=o.id)
-            model.delete()
+        if missing:
+            log.info("[OLT pull step] reconciled devices not present in VOLTHA",
+                     kept=[m.device_id for m in kept],
+                     deleted=[m.device_id for m in deleted],
+                     failed=[m.device_id for m in deleted_in_voltha if m not in deleted])
+
+    def delete_models(self, models):
+        """
+        Delete the given models one at a time, as XOS has no bulk delete. A failure on one model is logged and does not
+        prevent the others from being deleted.
+        :return: list of the deleted models
+        """
+        deleted = []
+
+        for model in models:
+            log.debug("[OLT pull step] deleting device as it's not present in VOLTHA", device_id=model.device_id,
+                      name=model.name, id=model.id)
+            try:
+                model.delete()
+                FingerprintCache.forget("OLTDevice", model)
+                FingerprintCache.forget("OLTDevice.ports", model)
+                deleted.append(model)
+            except Exception, e:
+                log.error("[OLT pull step] failed to delete device", device_id=model.device_id, name=model.name,
+                          id=model.id, reason=e)
+
+        return deleted
@@ -13,23 +13,44 @@
 # limitations under the License.
 
 from xossynchronizer.pull_steps.pullstep import PullStep
-from xossynchronizer.modelaccessor import model_accessor, ONUDevice, VOLTService, OLTDevice, PONPort, ANIPort, UNIPort
+from xossynchronizer.modelaccessor import model_accessor, ONUDevice, VOLTService, VOLTServiceInstance, OLTDevice, \
+    PONPort, ANIPort, UNIPort
 
 from xosconfig import Config
 from multistructlog import create_logger
 
-import requests
 from requests import ConnectionError
 from requests.models import InvalidURL
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
+from itertools import izip_longest
 
 import os, sys
+import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers import Helpers
+from voltha_client import VolthaClient  # noqa: E402
+from voltha_inventory import DeviceSnapshot, LogicalPortCache  # noqa: E402
+from fingerprints import FingerprintCache  # noqa: E402
+from olt_subscribers import OLTSubscriberIndex  # noqa: E402
 
 log = create_logger(Config().get('logging'))
 
 class ONUDevicePullStep(PullStep):
+
+    # maximum number of ONUs whose ports are being fetched from VOLTHA at the same time
+    max_concurrent_port_fetches = 32
+
+    # maximum number of those fetches targeting the ONUs of a single OLT, so that a slow adapter can't starve the
+    # others
+    max_concurrent_port_fetches_per_olt = 4
+
+    # time (in seconds) an ONU has to be missing from VOLTHA before its ONUDevice is deleted
+    deletion_grace_period = 300
+
+    # serial_number -> time an ONU was first found missing from VOLTHA, kept across the pull cycles
+    missing_since = {}
+
     def __init__(self, model_accessor):
         super(ONUDevicePullStep, self).__init__(model_accessor=model_accessor, observed_model=ONUDevice)
 
@@ -42,29 +63,23 @@ class ONUDevicePullStep(PullStep):
             log.warn('VOLTService not found')
             return
 
-        voltha_url = Helpers.get_voltha_info(self.volt_service)['url']
-        voltha_port = Helpers.get_voltha_info(self.volt_service)['port']
-
         try:
-            r = requests.get("%s:%s/api/v1/devices" % (voltha_url, voltha_port), timeout=1)
-
-            if r.status_code != 200:
-                log.warn("It was not possible to fetch devices from VOLTHA")
-
-            # [SEBA-367] Handling blank response received from Voltha, Scenario occurs when voltha api is called while vcore service is re-starting
+            snapshot = DeviceSnapshot.get(self.volt_service, consumer=self.__class__.__name__)
 
-            elif r.text:
+            if snapshot:
                 # keeping only ONUs
-                devices = [d for d in r.json()["items"] if "onu" in d["type"]]
+                devices = list(snapshot.onus)
 
                 log.debug("received devices", onus=devices)
 
-                # TODO
-                # [ ] delete ONUS as ONUDevice.objects.all() - updated ONUs
+                self.load_models()
+
+                # UNI port numbers are resolved against the logical device ports, fetched once per OLT in this cycle
+                self.logical_ports = LogicalPortCache(self.volt_service)
 
                 onus_in_voltha = self.create_or_update_onus(devices)
-            else:
-                log.debug("[ONU pull step] Blank response received")
+
+                self.delete_onus(devices)
 
         except (ValueError, TypeError), e:
             log.warn("[ONU pull step] Invalid Json received in response from VOLTHA", reason=e)
@@ -76,17 +91,31 @@ class ONUDevicePullStep(PullStep):
             log.warn("VOLTHA url is invalid, is it configured in the VOLTService?", reason=e)
             return
 
+    def load_models(self):
+        """
+        Load the ONUDevices, OLTDevices and PONPorts once per cycle, and index them by the keys used to match them with
+        the VOLTHA devices.
+        """
+        self.onus = ONUDevice.objects.all()
+
+        self.onus_by_serial_number = dict((m.serial_number, m) for m in self.onus)
+        self.olts_by_device_id = dict((m.device_id, m) for m in OLTDevice.objects.all() if m.device_id)
+        self.pon_ports_by_olt_and_port_no = dict(((m.olt_device_id, m.port_no), m) for m in PONPort.objects.all())
+
     def create_or_update_onus(self, onus):
 
         updated_onus = []
 
+        # (ONUDevice, OLTDevice) whose ports have to be pulled
+        onus_to_fetch = []
+
         for onu in onus:
             try:
 
-                model = ONUDevice.objects.filter(serial_number=onu["serial_number"])[0]
+                model = self.onus_by_serial_number[onu["serial_number"]]
                 log.debug("ONUDevice already exists, updating it", serial_number=onu["serial_number"])
 
-            except IndexError:
+            except KeyError:
                 model = ONUDevice()
                 model.serial_number = onu["serial_number"]
                 model.admin_state = onu["admin_state"]
@@ -94,17 +123,27 @@ class ONUDevicePullStep(PullStep):
                 log.debug("ONUDevice is new, creating it", serial_number=onu["serial_number"], admin_state=onu["admin_state"])
 
             try:
-                olt = OLTDevice.objects.get(device_id=onu["parent_id"])
-            except IndexError:
+                olt = self.olts_by_device_id[onu["parent_id"]]
+            except KeyError:
                 log.warning("Unable to find olt for ONUDevice", serial_number=onu["serial_number"], olt_device_id=onu["parent_id"])
                 continue
 
             try:
-                pon_port = PONPort.objects.get(port_no=onu["parent_port_no"], olt_device_id=olt.id)
-            except IndexError:
+                pon_port = self.pon_ports_by_olt_and_port_no[(olt.id, onu["parent_port_no"])]
+            except KeyError:
                 log.warning("Unable to find pon_port for ONUDevice", serial_number=onu["serial_number"], olt_device_id=onu["parent_id"], port_no=onu["parent_port_no"])
                 continue
 
+            # nothing to update if what VOLTHA reports has not changed since the last time the ONU was updated,
+            # its ports are pulled anyway
+            fingerprint = FingerprintCache.fingerprint(onu["vendor"], onu["type"], onu["id"], onu["oper_status"],
+                                                       onu["connect_status"], onu["reason"], pon_port.id,
+                                                       model.updated)
+            if FingerprintCache.unchanged("ONUDevice", model, fingerprint):
+                onus_to_fetch.append((model, olt))
+                updated_onus.append(model)
+                continue
+
             # Adding feedback state to the device
             model.vendor = onu["vendor"]
             model.device_type = onu["type"]
@@ -120,61 +159,179 @@ class ONUDevicePullStep(PullStep):
 
             model.save_changed_fields()
 
-            self.fetch_onu_ports(model)
+            FingerprintCache.update("ONUDevice", model, fingerprint)
+
+            # the subscribers of an ONU moving to another OLT are affected by the LOS of the new one
+            OLTSubscriberIndex.set_onu(model.id, olt.id)
+
+            onus_to_fetch.append((model, olt))
 
             updated_onus.append(model)
 
+        self.pull_onus_ports(onus_to_fetch)
+
         return updated_onus
 
-    def fetch_onu_ports(self, onu):
-        voltha_url = Helpers.get_voltha_info(self.volt_service)['url']
-        voltha_port = Helpers.get_voltha_info(self.volt_service)['port']
+    def delete_onus(self, onus_in_voltha):
+        """
+        Delete the ONUDevices discovered in VOLTHA (xos_managed=False) that have been missing from it for longer than
+        deletion_grace_period, so that a transient VOLTHA failure does not cause a mass deletion.
+
+        ONUDevices that are being synchronized (enacted < updated) are kept, as well as the ONUDevices that have
+        subscribers, as ONUDevice.delete refuses to remove them. Those are not even tried, until their subscribers are
+        removed.
+        :param onus_in_voltha: list of the ONU dictionaries returned by VOLTHA
+        """
+
+        serials_in_voltha = set(onu["serial_number"] for onu in onus_in_voltha)
+
+        missing = [m for m in self.onus if not m.xos_managed and m.serial_number not in serials_in_voltha]
+        missing_serials = set(m.serial_number for m in missing)
+
+        # forget about the ONUs that came back (or have been removed by someone else)
+        for serial_number in self.missing_since.keys():
+            if serial_number not in missing_serials:
+                del self.missing_since[serial_number]
+
+        now = time.time()
+        expired = []
 
+        for model in missing:
+            missing_since = self.missing_since.setdefault(model.serial_number, now)
+
+            if now - missing_since < self.deletion_grace_period:
+                log.debug("ONUDevice is not present in VOLTHA, waiting before deleting it",
+                          serial_number=model.serial_number, missing_for=now - missing_since)
+                continue
+
+            if model.enacted < model.updated:
+                # DO NOT delete a model that is being processed
+                log.debug("ONUDevice is not present in VOLTHA, skipping deletion as sync is in progress",
+                          serial_number=model.serial_number)
+                continue
+
+            expired.append(model)
+
+        if not expired:
+            return
+
+        # the subscribers of all the ONUs are loaded at once, only when there is something to delete
+        attached = set(si.onu_device_id for si in VOLTServiceInstance.objects.all())
+
+        deleted = []
+
+        for model in expired:
+            if model.id in attached:
+                log.debug("ONUDevice is not present in VOLTHA, skipping deletion as it has subscribers",
+                          serial_number=model.serial_number)
+                continue
+
+            try:
+                model.delete()
+                FingerprintCache.forget("ONUDevice", model)
+                FingerprintCache.forget("ONUDevice.ports", model)
+                del self.missing_since[model.serial_number]
+                deleted.append(model.serial_number)
+            except Exception, e:
+                log.warn("Unable to delete ONUDevice not present in VOLTHA", serial_number=model.serial_number,
+                         reason=e)
+
+        if deleted:
+            log.info("Deleted ONUDevices not present in VOLTHA", serial_numbers=deleted)
+
+    def pull_onus_ports(self, onus):
+        """
+        Fetch the ports of the given ONUs from VOLTHA and create or update the corresponding UNIPorts and ANIPorts.
+
+        The ONUs of each OLT are spread over at most max_concurrent_port_fetches_per_olt lanes, a lane fetches the
+        ports of its ONUs one after the other. The lanes of the different OLTs are interleaved and run on a pool of
+        max_concurrent_port_fetches threads, while the ports are saved from this thread as the lanes complete.
+        :param onus: list of (ONUDevice, OLTDevice)
+        """
+
+        if not onus:
+            return
+
+        onus_by_olt = OrderedDict()
+        for (onu, olt) in onus:
+            onus_by_olt.setdefault(olt.id, []).append((onu, olt))
+
+        lanes_by_olt = []
+        for olt_onus in onus_by_olt.values():
+            lanes_count = min(self.max_concurrent_port_fetches_per_olt, len(olt_onus))
+            lanes_by_olt.append([olt_onus[i::lanes_count] for i in range(lanes_count)])
+
+        # interleave the lanes, so that the workers are not all picking up the ONUs of the same OLT
+        lanes = [lane for lanes in izip_longest(*lanes_by_olt) for lane in lanes if lane is not None]
+
+        pool = ThreadPool(min(self.max_concurrent_port_fetches, len(lanes)))
         try:
-            r = requests.get("%s:%s/api/v1/devices/%s/ports" % (voltha_url, voltha_port, onu.device_id), timeout=1)
+            for fetched in pool.imap_unordered(self.fetch_lane_ports, lanes):
+                for (onu, olt, ports) in fetched:
+                    if ports is None:
+                        continue
+
+                    # nothing to do if the ports VOLTHA reports have not changed since the last time they were updated
+                    fingerprint = FingerprintCache.fingerprint(
+                        onu.device_id, olt.of_id,
+                        [(p["port_no"], p["label"], p["type"], p["admin_state"], p["oper_status"]) for p in ports])
+                    if FingerprintCache.unchanged("ONUDevice.ports", onu, fingerprint):
+                        continue
+
+                    self.create_or_update_ports(ports, onu, olt)
+
+                    FingerprintCache.update("ONUDevice.ports", onu, fingerprint)
+        finally:
+            pool.close()
+            pool.join()
+
+    def fetch_lane_ports(self, lane):
+        return [(onu, olt, self.fetch_onu_ports(onu, olt)) for (onu, olt) in lane]
+
+    def fetch_onu_ports(self, onu, olt):
+        """
+        Query VOLTHA for the ports of an ONU, and for the logical device ports of its OLT if the ONU has UNI ports.
+
+        Returns a list of port dictionaries, or None in case of error.
+        """
+        try:
+            r = VolthaClient.for_service(self.volt_service).device_ports(onu.device_id, timeout=1)
 
             if r.status_code != 200:
                 log.warn("It was not possible to fetch ports from VOLTHA for ONUDevice %s" % onu.device_id)
+                return None
 
             ports = r.json()['items']
 
             log.debug("received ports", ports=ports, onu=onu.device_id)
 
-            self.create_or_update_ports(ports, onu)
+            # resolve the UNI port numbers now, so that saving them does not wait on VOLTHA
+            if any("ETHERNET_UNI" in p["type"] for p in ports):
+                self.logical_ports.get_port_numbers(olt.of_id, onu.device_id)
+
+            return ports
 
         except ConnectionError, e:
             log.warn("It was not possible to connect to VOLTHA", reason=e)
-            return
+            return None
         except InvalidURL, e:
             log.warn("VOLTHA url is invalid, is it configured in the VOLTService?", reason=e)
-            return
-        return
+            return None
 
-    def create_or_update_ports(self, ports, onu):
+    def create_or_update_ports(self, ports, onu, olt):
         uni_ports = [p for p in ports if "ETHERNET_UNI" in p["type"]]
         pon_onu_ports = [p for p in ports if "PON_ONU" in p["type"]]
 
-        self.create_or_update_uni_port(uni_ports, onu)
+        self.create_or_update_uni_port(uni_ports, onu, olt)
         self.create_or_update_ani_port(pon_onu_ports, onu)
 
-    def get_onu_port_id(self, port, onu):
-        # find the correct port id as represented in the logical_device
-        logical_device_id = onu.pon_port.olt_device.of_id
-
-        voltha_url = Helpers.get_voltha_info(self.volt_service)['url']
-        voltha_port = Helpers.get_voltha_info(self.volt_service)['port']
+    def get_onu_port_id(self, port, onu, olt):
+        # find the correct port id as represented in the logical_device of the OLT, loaded with the other OLTs
+        logical_device_id = olt.of_id
 
         try:
-            r = requests.get("%s:%s/api/v1/logical_devices/%s/ports" % (voltha_url, voltha_port, logical_device_id), timeout=1)
-
-            if r.status_code != 200:
-                log.warn("It was not possible to fetch ports from VOLTHA for logical_device %s" % logical_device_id)
-
-            logical_ports = r.json()['items']
-            log.debug("logical device ports for ONUDevice %s" % onu.device_id, logical_ports=logical_ports)
-
-            ports = [p['ofp_port']['port_no'] for p in logical_ports if p['device_id'] == onu.device_id]
-            # log.debug("Port_id for port %s on ONUDevice %s: %s" % (port['label'], onu.device_id, ports), logical_ports=logical_ports)
+            ports = self.logical_ports.get_port_numbers(logical_device_id, onu.device_id)
+            # log.debug("Port_id for port %s on ONUDevice %s: %s" % (port['label'], onu.device_id, ports))
             # FIXME if this throws an error ONUs from other OTLs are not sync'ed
             return int(ports[0])
 
@@ -185,11 +342,11 @@ class ONUDevicePullStep(PullStep):
             log.warn("VOLTHA url is invalid, is it configured in the VOLTService?", reason=e)
             return
 
-    def create_or_update_uni_port(self, uni_ports, onu):
+    def create_or_update_uni_port(self, uni_ports, onu, olt):
         update_ports = []
 
         for port in uni_ports:
-            port_no = self.get_onu_port_id(port, onu)
+            port_no = self.get_onu_port_id(port, onu, olt)
             try:
                 model = UNIPort.objects.filter(port_no=port_no, onu_device_id=onu.id)[0]
                 log.debug("UNIPort already exists, updating it", port_no=port_no, onu_device_id=onu.id)
@@ -46,6 +46,15 @@ class TestSyncOLTDevice(unittest.TestCase):
 
         from pull_olts import OLTDevicePullStep
 
+        # the device snapshot and logical device index are shared across steps, make sure every test fetches its own
+        from voltha_inventory import DeviceSnapshot, LogicalDeviceIndex
+        DeviceSnapshot.clear()
+        LogicalDeviceIndex.clear()
+
+        # the fingerprints are kept across pull cycles, make sure every test starts from scratch
+        from fingerprints import FingerprintCache
+        FingerprintCache.clear()
+
         # import all class names to globals
         for (k, v) in model_accessor.all_model_classes.items():
             globals()[k] = v
@@ -195,14 +204,66 @@ class TestSyncOLTDevice(unittest.TestCase):
             mock_nni_save.assert_called()
 
 
+    @requests_mock.Mocker()
+    def test_pull_multiple_olts(self, m):
+        devices = {
+            "items": [
+                {
+                    "id": "olt_%s" % i,
+                    "type": "openolt",
+                    "host_and_port": "10.0.0.%s:9191" % i,
+                    "admin_state": "ENABLED",
+                    "oper_status": "ACTIVE",
+                    "serial_number": "serial_number_%s" % i,
+                } for i in range(5)
+            ]
+        }
+
+        logical_devices = {
+            "items": [
+                {
+                    "root_device_id": "olt_%s" % i,
+                    "id": "of_id_%s" % i,
+                    "datapath_id": "55334486016"
+                } for i in range(5)
+            ]
+        }
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice, "save", autospec=True) as mock_olt_save, \
+                patch.object(PONPort, "save") as mock_pon_save, \
+                patch.object(NNIPort, "save") as mock_nni_save, \
+                patch.object(self.sync_step, "max_concurrent_port_fetches", 2):
+            olt_service_mock.return_value = [self.volt_service]
+
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=devices)
+            m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=logical_devices)
+            for i in range(5):
+                m.get("http://voltha_url:1234/api/v1/devices/olt_%s/ports" % i, status_code=200, json=self.ports)
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            # the OLTs are saved in the order VOLTHA returned them, regardless of the order the ports came back in
+            saved_olts = [c[0][0] for c in mock_olt_save.call_args_list]
+            self.assertEqual([o.device_id for o in saved_olts], ["olt_%s" % i for i in range(5)])
+            self.assertEqual([o.of_id for o in saved_olts], ["of_id_%s" % i for i in range(5)])
+
+            self.assertEqual(mock_pon_save.call_count, 5)
+            self.assertEqual(mock_nni_save.call_count, 5)
+
     @requests_mock.Mocker()
     def test_pull_existing(self, m):
 
         existing_olt = Mock()
+        existing_olt.device_type = "simulated_olt"
+        existing_olt.host = "172.17.0.1"
+        existing_olt.port = 50060
+        existing_olt.mac_address = None
         existing_olt.admin_state = "ENABLED"
         existing_olt.enacted = 2
         existing_olt.updated = 1
         existing_olt.serial_number = ""
+        existing_olt.activation_started = 1000
 
         with patch.object(VOLTService.objects, "all") as olt_service_mock, \
                 patch.object(OLTDevice.objects, "filter") as mock_get, \
@@ -226,14 +287,100 @@ class TestSyncOLTDevice(unittest.TestCase):
             self.assertEqual(existing_olt.dp_id, "of:0000000ce2314000")
             self.assertEqual(existing_olt.serial_number, "serial_number")
 
+            # the OLT is ACTIVE, it's not activating anymore
+            self.assertIsNone(existing_olt.activation_started)
+
+            # the OLTDevices are loaded once, and matched in memory
+            mock_get.assert_called_once_with(volt_service_id="volt_service_id")
+
             # mock_olt_save.assert_called()
             mock_pon_save.assert_called()
             mock_nni_save.assert_called()
 
+    @requests_mock.Mocker()
+    def test_pull_existing_unchanged(self, m):
+
+        existing_olt = Mock()
+        existing_olt.id = 1
+        existing_olt.device_type = "simulated_olt"
+        existing_olt.host = "172.17.0.1"
+        existing_olt.port = 50060
+        existing_olt.mac_address = None
+        existing_olt.admin_state = "ENABLED"
+        existing_olt.enacted = 2
+        existing_olt.updated = 1
+        existing_olt.serial_number = "serial_number"
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "filter") as mock_get, \
+                patch.object(PONPort, "save") as mock_pon_save, \
+                patch.object(NNIPort, "save") as mock_nni_save:
+            olt_service_mock.return_value = [self.volt_service]
+            mock_get.return_value = [existing_olt]
+
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+            m.get("http://voltha_url:1234/api/v1/devices/test_id/ports", status_code=200, json=self.ports)
+            m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            # the second cycle does not touch the models, as nothing changed in VOLTHA
+            self.assertEqual(existing_olt.save_changed_fields.call_count, 1)
+            self.assertEqual(mock_pon_save.call_count, 1)
+            self.assertEqual(mock_nni_save.call_count, 1)
+
+            self.devices["items"][0]["oper_status"] = "UNKNOWN"
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            self.assertEqual(existing_olt.save_changed_fields.call_count, 2)
+            self.assertEqual(existing_olt.oper_status, "UNKNOWN")
+
+    @requests_mock.Mocker()
+    def test_pull_existing_unchanged_no_logical_device(self, m):
+
+        existing_olt = Mock()
+        existing_olt.id = 1
+        existing_olt.device_type = "simulated_olt"
+        existing_olt.host = "172.17.0.1"
+        existing_olt.port = 50060
+        existing_olt.mac_address = None
+        existing_olt.admin_state = "DISABLED"
+        existing_olt.enacted = 2
+        existing_olt.updated = 1
+        existing_olt.serial_number = "serial_number"
+
+        self.devices["items"][0]["admin_state"] = "DISABLED"
+        self.devices["items"][0]["oper_status"] = "UNKNOWN"
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "filter") as mock_get, \
+                patch.object(PONPort, "save"), \
+                patch.object(NNIPort, "save"):
+            olt_service_mock.return_value = [self.volt_service]
+            mock_get.return_value = [existing_olt]
+
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+            m.get("http://voltha_url:1234/api/v1/devices/test_id/ports", status_code=200, json=self.ports)
+            m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json={"items": []})
+            device = m.get("http://voltha_url:1234/api/v1/devices/test_id", status_code=200,
+                           json={"id": "test_id", "parent_id": ""})
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            # the disabled OLT has no logical device, it is refreshed only while updating it in the first cycle
+            self.assertEqual(existing_olt.save_changed_fields.call_count, 1)
+            self.assertEqual(device.call_count, 1)
+
     @requests_mock.Mocker()
     def test_pull_existing_empty_voltha_serial(self, m):
 
         existing_olt = Mock()
+        existing_olt.device_type = "simulated_olt"
+        existing_olt.host = "172.17.0.1"
+        existing_olt.port = 50060
+        existing_olt.mac_address = None
         existing_olt.admin_state = "ENABLED"
         existing_olt.enacted = 2
         existing_olt.updated = 1
@@ -271,6 +418,10 @@ class TestSyncOLTDevice(unittest.TestCase):
     def test_pull_existing_incorrect_voltha_serial(self, m):
 
         existing_olt = Mock()
+        existing_olt.device_type = "simulated_olt"
+        existing_olt.host = "172.17.0.1"
+        existing_olt.port = 50060
+        existing_olt.mac_address = None
         existing_olt.admin_state = "ENABLED"
         existing_olt.enacted = 2
         existing_olt.updated = 1
@@ -299,6 +450,10 @@ class TestSyncOLTDevice(unittest.TestCase):
     @requests_mock.Mocker()
     def test_pull_existing_do_not_sync(self, m):
         existing_olt = Mock()
+        existing_olt.device_type = "simulated_olt"
+        existing_olt.host = "172.17.0.1"
+        existing_olt.port = 50060
+        existing_olt.mac_address = None
         existing_olt.enacted = 1
         existing_olt.updated = 2
         existing_olt.device_id = "test_id"
@@ -328,6 +483,7 @@ class TestSyncOLTDevice(unittest.TestCase):
         existing_olt.enacted = 2
         existing_olt.updated = 1
         existing_olt.device_id = "test_id"
+        existing_olt.volt_service_id = "volt_service_id"
 
         m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json={"items": []})
 
@@ -342,6 +498,48 @@ class TestSyncOLTDevice(unittest.TestCase):
 
             mock_olt_delete.assert_called()
 
+    @requests_mock.Mocker()
+    def test_pull_deleted_objects(self, m):
+        def olt(device_id, enacted=2, updated=1):
+            o = Mock()
+            o.device_id = device_id
+            o.volt_service_id = "volt_service_id"
+            o.enacted = enacted
+            o.updated = updated
+            return o
+
+        in_voltha = olt("test_id")
+        in_voltha.device_type = "simulated_olt"
+        in_voltha.host = "172.17.0.1"
+        in_voltha.port = 50060
+        in_voltha.serial_number = "serial_number"
+        missing = olt("missing_id")
+        syncing = olt("syncing_id", enacted=1, updated=2)
+        failing = olt("failing_id")
+        failing.delete.side_effect = Exception("MockError")
+        never_provisioned = olt(None)
+
+        m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+        m.get("http://voltha_url:1234/api/v1/devices/test_id/ports", status_code=200, json=self.ports)
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "get_items") as mock_get, \
+                patch.object(PONPort, "save") as mock_pon_save, \
+                patch.object(NNIPort, "save") as mock_nni_save:
+
+            olt_service_mock.return_value = [self.volt_service]
+            mock_get.return_value = [in_voltha, missing, syncing, failing, never_provisioned]
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            in_voltha.delete.assert_not_called()
+            syncing.delete.assert_not_called()
+            missing.delete.assert_called_once()
+            never_provisioned.delete.assert_called_once()
+            # a failure does not prevent the other deletions
+            failing.delete.assert_called_once()
+
 #[SEBA-367] Unit test for blank response recieved from Voltha
 
     @requests_mock.Mocker()
@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import functools
 import unittest
 from mock import patch, call, Mock, PropertyMock
 import requests_mock
@@ -46,6 +45,15 @@ class TestPullONUDevice(unittest.TestCase):
         self.model_accessor = model_accessor
 
         from pull_onus import ONUDevicePullStep
+        ONUDevicePullStep.missing_since.clear()
+
+        # the device snapshot is shared across pull steps, make sure every test fetches its own
+        from voltha_inventory import DeviceSnapshot
+        DeviceSnapshot.clear()
+
+        # the fingerprints are kept across pull cycles, make sure every test starts from scratch
+        from fingerprints import FingerprintCache
+        FingerprintCache.clear()
 
         # import all class names to globals
         for (k, v) in model_accessor.all_model_classes.items():
@@ -64,18 +72,24 @@ class TestPullONUDevice(unittest.TestCase):
         # mock OLTDevice
         self.olt = Mock()
         self.olt.id = 1
+        self.olt.device_id = "00010fc93996afea"
 
         # second mock OLTDevice
         self.olt2 = Mock()
         self.olt2.id = 2
+        self.olt2.device_id = "00010fc93996afeb"
 
         # mock pon port
         self.pon_port = Mock()
         self.pon_port.id = 1
+        self.pon_port.port_no = 1
+        self.pon_port.olt_device_id = 1
 
         # mock pon port
         self.pon_port2 = Mock()
         self.pon_port2.id = 2
+        self.pon_port2.port_no = 1
+        self.pon_port2.olt_device_id = 2
 
         # mock voltha responses
         self.devices = {
@@ -149,12 +163,12 @@ class TestPullONUDevice(unittest.TestCase):
     def test_pull(self, m):
 
         with patch.object(VOLTService.objects, "all") as olt_service_mock, \
-                patch.object(OLTDevice.objects, "get") as mock_olt_device, \
-                patch.object(PONPort.objects, "get") as mock_pon_port, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
                 patch.object(ONUDevice, "save", autospec=True) as mock_save:
             olt_service_mock.return_value = [self.volt_service]
-            mock_pon_port.return_value = self.pon_port
-            mock_olt_device.return_value = self.olt
+            mock_pon_port.return_value = [self.pon_port]
+            mock_olt_device.return_value = [self.olt]
 
             m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
             m.get("http://voltha_url:1234/api/v1/devices/0001130158f01b2d/ports", status_code=200, json=self.ports)
@@ -174,28 +188,97 @@ class TestPullONUDevice(unittest.TestCase):
             self.assertEqual(mock_save.call_count, 1)
 
     @requests_mock.Mocker()
-    def test_pull_bad_pon(self, m):
+    def test_pull_existing_unchanged(self, m):
+        existing_onu = Mock()
+        existing_onu.id = 1
+        existing_onu.serial_number = "BRCM22222222"
+        existing_onu.xos_managed = False
+        existing_onu.updated = 1
 
-        def olt_side_effect(device_id):
-            # fail the first onu device
-            if device_id=="00010fc93996afea":
-                return self.olt
-            else:
-                return self.olt2
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
+                patch.object(ONUDevice.objects, "get_items") as mock_onus:
+            olt_service_mock.return_value = [self.volt_service]
+            mock_pon_port.return_value = [self.pon_port]
+            mock_olt_device.return_value = [self.olt]
+            mock_onus.return_value = [existing_onu]
 
-        def pon_port_side_effect(mock_pon_port, port_no, olt_device_id):
-            # fail the first onu device
-            if olt_device_id==1:
-                raise IndexError()
-            return self.pon_port2
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+            m.get("http://voltha_url:1234/api/v1/devices/0001130158f01b2d/ports", status_code=200, json=self.ports)
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            # the second cycle does not touch the model, as nothing changed in VOLTHA
+            self.assertEqual(existing_onu.save_changed_fields.call_count, 1)
+
+            self.devices["items"][0]["oper_status"] = "UNKNOWN"
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            self.assertEqual(existing_onu.save_changed_fields.call_count, 2)
+            self.assertEqual(existing_onu.oper_status, "UNKNOWN")
+
+    @requests_mock.Mocker()
+    def test_pull_ports(self, m):
+        devices = {"items": [dict(self.devices["items"][0], id="onu_%s" % i, serial_number="BRCM%s" % i)
+                             for i in range(6)]}
+
+        onu_ports = {
+            "items": [
+                {"label": "PON port", "port_no": 1, "type": "PON_ONU", "admin_state": "ENABLED",
+                 "oper_status": "ACTIVE"},
+                {"label": "UNI port", "port_no": 16, "type": "ETHERNET_UNI", "admin_state": "ENABLED",
+                 "oper_status": "ACTIVE"},
+            ]
+        }
+
+        logical_ports = {
+            "items": [{"device_id": "onu_%s" % i, "ofp_port": {"port_no": 100 + i}} for i in range(6)]
+        }
+
+        # the logical device of the ONUs is the one of the OLT they were matched with, not walked from their PON port
+        self.olt.of_id = "of_id"
+        self.pon_port.olt_device = None
 
         with patch.object(VOLTService.objects, "all") as olt_service_mock, \
-                patch.object(OLTDevice.objects, "get") as mock_olt_device, \
-                patch.object(PONPort.objects, "get") as mock_pon_port, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
+                patch.object(ONUDevice, "save", autospec=True) as mock_save, \
+                patch.object(UNIPort, "save", autospec=True) as mock_uni_save, \
+                patch.object(ANIPort, "save", autospec=True) as mock_ani_save, \
+                patch.object(self.sync_step, "max_concurrent_port_fetches_per_olt", 2):
+            olt_service_mock.return_value = [self.volt_service]
+            mock_pon_port.return_value = [self.pon_port]
+            mock_olt_device.return_value = [self.olt]
+
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=devices)
+            for i in range(6):
+                m.get("http://voltha_url:1234/api/v1/devices/onu_%s/ports" % i, status_code=200, json=onu_ports)
+            m.get("http://voltha_url:1234/api/v1/logical_devices/of_id/ports", status_code=200, json=logical_ports)
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            self.assertEqual(mock_save.call_count, 6)
+            self.assertEqual(mock_ani_save.call_count, 6)
+
+            # the UNI port numbers are the ones of the logical device, fetched once for the OLT
+            uni_ports = sorted(c[0][0].port_no for c in mock_uni_save.call_args_list)
+            self.assertEqual(uni_ports, [100 + i for i in range(6)])
+            logical_ports_requests = [r for r in m.request_history if r.path.endswith("/logical_devices/of_id/ports")]
+            self.assertEqual(len(logical_ports_requests), 1)
+
+    @requests_mock.Mocker()
+    def test_pull_bad_pon(self, m):
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
                 patch.object(ONUDevice, "save", autospec=True) as mock_save:
             olt_service_mock.return_value = [self.volt_service]
-            mock_pon_port.side_effect = functools.partial(pon_port_side_effect, self.pon_port)
-            mock_olt_device.side_effect = olt_side_effect
+            # fail the first onu device
+            mock_pon_port.return_value = [self.pon_port2]
+            mock_olt_device.return_value = [self.olt, self.olt2]
 
             m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.two_devices)
             m.get("http://voltha_url:1234/api/v1/devices/0001130158f01b2d/ports", status_code=200, json=self.ports)
@@ -221,20 +304,14 @@ class TestPullONUDevice(unittest.TestCase):
     @requests_mock.Mocker()
     def test_pull_bad_olt(self, m):
 
-        def olt_side_effect(device_id):
-            # fail the first onu device
-            if device_id=="00010fc93996afea":
-                raise IndexError()
-            else:
-                return self.olt2
-
         with patch.object(VOLTService.objects, "all") as olt_service_mock, \
-                patch.object(OLTDevice.objects, "get") as mock_olt_device, \
-                patch.object(PONPort.objects, "get") as mock_pon_port, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
                 patch.object(ONUDevice, "save", autospec=True) as mock_save:
             olt_service_mock.return_value = [self.volt_service]
-            mock_pon_port.return_value = self.pon_port2
-            mock_olt_device.side_effect = olt_side_effect
+            mock_pon_port.return_value = [self.pon_port2]
+            # fail the first onu device
+            mock_olt_device.return_value = [self.olt2]
 
             m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.two_devices)
             m.get("http://voltha_url:1234/api/v1/devices/0001130158f01b2d/ports", status_code=200, json=self.ports)
@@ -257,6 +334,80 @@ class TestPullONUDevice(unittest.TestCase):
 
             self.assertEqual(mock_save.call_count, 1)
 
+    @requests_mock.Mocker()
+    def test_pull_deleted_onus(self, m):
+        def onu(serial_number, xos_managed=False, enacted=2, updated=1):
+            o = Mock()
+            o.id = serial_number
+            o.serial_number = serial_number
+            o.xos_managed = xos_managed
+            o.enacted = enacted
+            o.updated = updated
+            return o
+
+        missing = onu("BRCM_MISSING")
+        syncing = onu("BRCM_SYNCING", enacted=1, updated=2)
+        with_subscriber = onu("BRCM_SUBSCRIBER")
+        failing = onu("BRCM_FAILING")
+        failing.delete.side_effect = Exception("Mock Error")
+        not_discovered = onu("BRCM_XOS", xos_managed=True)
+        in_voltha = onu("BRCM22222222")
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
+                patch.object(ONUDevice.objects, "get_items") as mock_onus, \
+                patch.object(VOLTServiceInstance.objects, "get_items") as mock_volt_sis, \
+                patch.object(ONUDevice, "save", autospec=True) as mock_save:
+            olt_service_mock.return_value = [self.volt_service]
+            mock_pon_port.return_value = [self.pon_port]
+            mock_olt_device.return_value = [self.olt]
+            mock_onus.return_value = [missing, syncing, with_subscriber, failing, not_discovered, in_voltha]
+            mock_volt_sis.return_value = [VOLTServiceInstance(onu_device_id="BRCM_SUBSCRIBER")]
+
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+            m.get("http://voltha_url:1234/api/v1/devices/0001130158f01b2d/ports", status_code=200, json=self.ports)
+
+            # ONUs are not deleted as soon as they disappear from VOLTHA
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+            missing.delete.assert_not_called()
+            mock_volt_sis.assert_not_called()
+
+            with patch.object(self.sync_step, "deletion_grace_period", -1):
+                self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            missing.delete.assert_called_once()
+            failing.delete.assert_called_once()
+            syncing.delete.assert_not_called()
+            not_discovered.delete.assert_not_called()
+            in_voltha.delete.assert_not_called()
+
+            # the ONUs with subscribers are not even tried
+            with_subscriber.delete.assert_not_called()
+
+            # the ONUs that could not be deleted are still tracked
+            self.assertEqual(sorted(self.sync_step.missing_since.keys()),
+                             ["BRCM_FAILING", "BRCM_SUBSCRIBER", "BRCM_SYNCING"])
+
+    @requests_mock.Mocker()
+    def test_pull_onu_back_in_voltha(self, m):
+        self.sync_step.missing_since["BRCM22222222"] = 0
+
+        with patch.object(VOLTService.objects, "all") as olt_service_mock, \
+                patch.object(OLTDevice.objects, "get_items") as mock_olt_device, \
+                patch.object(PONPort.objects, "get_items") as mock_pon_port, \
+                patch.object(ONUDevice, "save", autospec=True) as mock_save:
+            olt_service_mock.return_value = [self.volt_service]
+            mock_pon_port.return_value = [self.pon_port]
+            mock_olt_device.return_value = [self.olt]
+
+            m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+            m.get("http://voltha_url:1234/api/v1/devices/0001130158f01b2d/ports", status_code=200, json=self.ports)
+
+            self.sync_step(model_accessor=self.model_accessor).pull_records()
+
+            self.assertEqual(self.sync_step.missing_since, {})
+
 #[SEBA-367] Unit test for blank response recieved from Voltha
 
     @requests_mock.Mocker()
@@ -264,8 +415,8 @@ class TestPullONUDevice(unittest.TestCase):
 
         m.get("http://voltha_url:1234/api/v1/devices", status_code=200, text="")
         with patch.object(VOLTService.objects, "all") as olt_service_mock, \
-        patch.object(PONPort.objects, "get") as mock_pon_port, \
-                patch.object(OLTDevice.objects, "get") as mock_get, \
+        patch.object(PONPort.objects, "get_items") as mock_pon_port, \
+                patch.object(OLTDevice.objects, "get_items") as mock_get, \
                 patch.object(ONUDevice, "save", autospec=True) as mock_save:
 
             olt_service_mock.return_value = [self.volt_service]
@@ -284,8 +435,8 @@ class TestPullONUDevice(unittest.TestCase):
 
         m.get("http://voltha_url:1234/api/v1/devices", status_code=200, text="{\"items\" : [host_and_port}")
         with patch.object(VOLTService.objects, "all") as olt_service_mock, \
-        patch.object(PONPort.objects, "get") as mock_pon_port, \
-                patch.object(OLTDevice.objects, "get") as mock_get, \
+        patch.object(PONPort.objects, "get_items") as mock_pon_port, \
+                patch.object(OLTDevice.objects, "get_items") as mock_get, \
                 patch.object(ONUDevice, "save", autospec=True) as mock_save:
 
             olt_service_mock.return_value = [self.volt_service]
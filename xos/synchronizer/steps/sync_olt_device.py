@@ -12,51 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
 from time import sleep
 
 import requests
 from multistructlog import create_logger
-from requests.auth import HTTPBasicAuth
 from xossynchronizer.steps.syncstep import SyncStep, DeferredException
-from xossynchronizer.modelaccessor import OLTDevice, TechnologyProfile, model_accessor
+from xossynchronizer.modelaccessor import OLTDevice, model_accessor
 from xosconfig import Config
 
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers import Helpers
+from olt_attachments import OLTAttachmentIndex
+from onos_client import OnosClient
+from onos_netcfg import OnosNetworkConfig
+from technology_profiles import TechnologyProfileIndex
+from voltha_client import VolthaClient
+from voltha_inventory import LogicalDeviceIndex
 
 log = create_logger(Config().get('logging'))
 
+
+class NetworkConfigBatch(object):
+    """
+    The ONOS network configuration of the active OLTs of a VOLTService pending in a sync cycle. It is reconciled with
+    ONOS by the first of those OLTs reaching configure_onos: the devices configuration is read once and the entries
+    ONOS doesn't have yet are pushed with a single request.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.reconciled = False
+        self.lock = threading.Lock()
+
+    def reconcile(self, onos):
+        """
+        :param onos: OnosClient
+        """
+        with self.lock:
+            if self.reconciled:
+                return
+            self.reconciled = True
+
+            try:
+                OnosNetworkConfig.refresh(onos)
+
+                devices = OnosNetworkConfig.changes(onos, self.devices)
+                if not devices:
+                    return
+
+                request = OnosNetworkConfig.push(onos, devices)
+
+                if request.status_code != 200:
+                    log.warning("Failed to add OLT devices into ONOS", devices=devices.keys(), response=request.text)
+            except requests.exceptions.RequestException, e:
+                log.warning("Failed to add OLT devices into ONOS", url=onos.base_url, reason=e)
+
+
 class SyncOLTDevice(SyncStep):
     provides = [OLTDevice]
     observes = OLTDevice
 
-    max_attempt = 120  # we give 10 minutes to the OLT to activate
-
-    @staticmethod
-    def get_ids_from_logical_device(o):
-        voltha = Helpers.get_voltha_info(o.volt_service)
+    activation_timeout = 600  # we give 10 minutes to the OLT to activate
 
-        request = requests.get("%s:%d/api/v1/logical_devices" % (voltha['url'], voltha['port']))
+    # before deleting an OLT we wait (at most disable_timeout seconds) for VOLTHA to report it as disabled, checking
+    # its state with a delay starting at disable_poll_interval and doubling up to disable_poll_max_interval
+    disable_timeout = 10
+    disable_poll_interval = 0.25
+    disable_poll_max_interval = 2
 
-        if request.status_code != 200:
-            raise Exception("Failed to retrieve logical devices from VOLTHA: %s" % request.text)
+    _lock = threading.Lock()
+    _netcfg_batches = {}  # VOLTService id -> NetworkConfigBatch, for the OLTs fetched in this cycle
 
-        response = request.json()
+    @staticmethod
+    def get_ids_from_logical_device(o):
+        logical_device = LogicalDeviceIndex.lookup(o.volt_service, o.device_id)
 
-        for ld in response["items"]:
-            if ld["root_device_id"] == o.device_id:
-                o.of_id = ld["id"]
-                o.dp_id = "of:%s" % (Helpers.datapath_id_to_hex(ld["datapath_id"])) # Convert to hex
-                return o
+        if not logical_device:
+            raise Exception("Can't find a logical_device for OLT device id: %s" % o.device_id)
 
-        raise Exception("Can't find a logical_device for OLT device id: %s" % o.device_id)
+        o.of_id = logical_device["of_id"]
+        o.dp_id = logical_device["dp_id"]
+        return o
 
     def pre_provision_olt_device(self, model):
         log.info("Pre-provisioning OLT device in VOLTHA", object=str(model), **model.tologdict())
 
-        voltha = Helpers.get_voltha_info(model.volt_service)
+        voltha = VolthaClient.for_service(model.volt_service)
 
         data = {
             "type": model.device_type
@@ -69,7 +113,7 @@ class SyncOLTDevice(SyncStep):
 
         log.info("Pushing OLT to Voltha", data=data)
 
-        request = requests.post("%s:%d/api/v1/devices" % (voltha['url'], voltha['port']), json=data)
+        request = voltha.create_device(data)
 
         if request.status_code != 200:
             raise Exception("Failed to add OLT device: %s" % request.text)
@@ -102,27 +146,29 @@ class SyncOLTDevice(SyncStep):
             model.save_changed_fields()
 
     def activate_olt(self, model):
+        """
+        Enable the OLT and check whether it is active, without waiting for it.
 
-        attempted = 0
+        The time the OLT was enabled is stored in activation_started. While the OLT is activating a DeferredException
+        is raised, so that the following sync passes check the OLT again instead of enabling it a second time, until
+        it becomes ACTIVE or activation_timeout expires.
+        """
 
-        voltha = Helpers.get_voltha_info(model.volt_service)
+        voltha = VolthaClient.for_service(model.volt_service)
 
-        # Enable device
-        request = requests.post("%s:%d/api/v1/devices/%s/enable" % (voltha['url'], voltha['port'], model.device_id))
+        if not model.activation_started:
+            # Enable device
+            request = voltha.enable(model.device_id)
 
-        if request.status_code != 200:
-            raise Exception("Failed to enable OLT device: %s" % request.text)
+            if request.status_code != 200:
+                raise Exception("Failed to enable OLT device: %s" % request.text)
 
-        model.backend_status = "Waiting for device to be activated"
-        model.save_changed_fields(always_update_timestamp=False) # we don't want to kickoff a new loop
+            model.activation_started = time.time()
+            model.backend_status = "Waiting for device to be activated"
+            model.save_changed_fields(always_update_timestamp=False) # we don't want to kickoff a new loop
 
         # Read state
-        request = requests.get("%s:%d/api/v1/devices/%s" % (voltha['url'], voltha['port'], model.device_id)).json()
-        while request['oper_status'] == "ACTIVATING" and attempted < self.max_attempt:
-            log.info("Waiting for OLT device %s (%s) to activate" % (model.name, model.device_id))
-            sleep(5)
-            request = requests.get("%s:%d/api/v1/devices/%s" % (voltha['url'], voltha['port'], model.device_id)).json()
-            attempted = attempted + 1
+        request = voltha.get_device(model.device_id).json()
 
         model.oper_status = request['oper_status']
 
@@ -135,7 +181,15 @@ class SyncOLTDevice(SyncStep):
                      olt_id=model.id)
             model.serial_number = request['serial_number']
 
+        if model.oper_status == "ACTIVATING" and time.time() - model.activation_started < self.activation_timeout:
+            log.info("Waiting for OLT device %s (%s) to activate" % (model.name, model.device_id))
+            raise DeferredException("Waiting for OLT device %s (%s) to activate" % (model.name, model.device_id))
+
+        # the activation is over, a new one will enable the device again
+        model.activation_started = None
+
         if model.oper_status != "ACTIVE":
+            model.save_changed_fields(always_update_timestamp=False)
             raise Exception("It was not possible to activate OLTDevice with id %s" % model.id)
 
         # Find the of_id of the device
@@ -143,45 +197,85 @@ class SyncOLTDevice(SyncStep):
         model.save_changed_fields()
 
     def deactivate_olt(self, model):
-        voltha = Helpers.get_voltha_info(model.volt_service)
+        voltha = VolthaClient.for_service(model.volt_service)
 
         # Disable device
-        request = requests.post("%s:%d/api/v1/devices/%s/disable" % (voltha['url'], voltha['port'], model.device_id))
+        request = voltha.disable(model.device_id)
 
         if request.status_code != 200:
             raise Exception("Failed to disable OLT device: %s" % request.text)
 
+    @staticmethod
+    def onos_device_config(model):
+        return {
+            model.dp_id: {
+                "basic": {
+                    "name": model.name
+                }
+            }
+        }
+
     def configure_onos(self, model):
+        onos = OnosClient.for_service(model.volt_service)
 
-        log.info("Adding OLT device in onos-voltha", object=str(model), **model.tologdict())
+        # the OLTs of the VOLTService that were already active are configured with a single request
+        with SyncOLTDevice._lock:
+            batch = SyncOLTDevice._netcfg_batches.get(model.volt_service_id)
+        if batch is not None:
+            batch.reconcile(onos)
 
-        onos_voltha = Helpers.get_onos_voltha_info(model.volt_service)
-        onos_voltha_basic_auth = HTTPBasicAuth(onos_voltha['user'], onos_voltha['pass'])
+        # Add device info to onos-voltha, unless it's already there
+        devices = OnosNetworkConfig.changes(onos, self.onos_device_config(model))
 
-        # Add device info to onos-voltha
-        data = {
-            "devices": {
-                model.dp_id: {
-                    "basic": {
-                        "name": model.name
-                    }
-                }
-            }
-        }
+        if not devices:
+            log.debug("OLT device is already configured in onos-voltha", object=str(model), **model.tologdict())
+            return
 
-        log.info("Calling ONOS", data=data)
+        log.info("Adding OLT device in onos-voltha", object=str(model), **model.tologdict())
 
-        url = "%s:%d/onos/v1/network/configuration/" % (onos_voltha['url'], onos_voltha['port'])
-        request = requests.post(url, json=data, auth=onos_voltha_basic_auth)
+        request = OnosNetworkConfig.push(onos, devices)
 
         if request.status_code != 200:
             log.error(request.text)
             raise Exception("Failed to add OLT device %s into ONOS" % model.name)
-        else:
-            try:
-                print request.json()
-            except Exception:
-                print request.text
+
+    def batch_onos_config(self, models):
+        """
+        Group the ONOS network configuration of the OLTs that are already active by VOLTService, so that configure_onos
+        reconciles each group with ONOS once. Nothing is requested from ONOS here.
+        """
+        batches = {}
+
+        for model in models:
+            if model.admin_state == "ENABLED" and model.oper_status == "ACTIVE" and model.dp_id:
+                batch = batches.setdefault(model.volt_service_id, NetworkConfigBatch())
+                batch.devices.update(self.onos_device_config(model))
+
+        with SyncOLTDevice._lock:
+            SyncOLTDevice._netcfg_batches = batches
+
+    def fetch_pending(self, deletion=False):
+        models = super(SyncOLTDevice, self).fetch_pending(deletion)
+
+        # the ONOS port events of a fabric port an OLT has just been attached to are not dropped
+        OLTAttachmentIndex.update(models, deleted=deletion)
+
+        if not deletion:
+            (pending, waiting) = ([], [])
+            for model in models:
+                (waiting if self.waiting_for_tp(model) else pending).append(model)
+
+            if waiting:
+                log.debug("OLT devices waiting for a TechnologyProfile", olts=[m.name for m in waiting])
+            models = pending
+
+            self.batch_onos_config(models)
+
+        return models
+
+    @staticmethod
+    def waiting_for_tp_message(technology):
+        return "Waiting for a TechnologyProfile (technology=%s) to be synchronized" % technology
 
     def wait_for_tp(self, technology):
         """
@@ -190,13 +284,20 @@ class SyncOLTDevice(SyncStep):
         :param technology: string - the technology to check for a tech profile
         :return: True (or raises DeferredException)
         """
-        try:
-            tps = TechnologyProfile.objects.get(technology=technology, backend_code=1)
-        except IndexError:
-            raise DeferredException("Waiting for a TechnologyProfile (technology=%s) to be synchronized" % technology)
+        if not TechnologyProfileIndex.is_ready(technology):
+            raise DeferredException(self.waiting_for_tp_message(technology))
 
         return True
 
+    def waiting_for_tp(self, model):
+        """
+        Whether the OLT has already been deferred waiting for a technology profile that is still not there.
+        Such an OLT is left out of the sync cycles, until a profile for its technology is synchronized.
+        """
+        return model.backend_code == 0 and \
+               self.waiting_for_tp_message(model.technology) in (model.backend_status or "") and \
+               not TechnologyProfileIndex.is_ready(model.technology)
+
     def sync_record(self, model):
         log.info("Synching device", object=str(model), **model.tologdict())
 
@@ -210,6 +311,7 @@ class SyncOLTDevice(SyncStep):
             log.info("Pushing OLT device to VOLTHA", object=str(model), **model.tologdict())
             self.pre_provision_olt_device(model)
             model.oper_status = "UNKNOWN" # fall-though to activate OLT
+            model.activation_started = None
         else:
             log.info("OLT device already exists in VOLTHA", object=str(model), **model.tologdict())
 
@@ -220,6 +322,12 @@ class SyncOLTDevice(SyncStep):
         elif model.oper_status == "ACTIVE" and model.admin_state == "DISABLED":
             self.deactivate_olt(model)
 
+        if model.activation_started and (model.admin_state == "DISABLED" or model.oper_status == "ACTIVE"):
+            # the OLT has been disabled while activating, or it has become ACTIVE without this step noticing (ie: it
+            # was found ACTIVE by the pull step)
+            model.activation_started = None
+            model.save_changed_fields(always_update_timestamp=False)
+
         if model.admin_state == "ENABLED":
             # If we were not able to reconcile ENABLE/ACTIVE, then throw an exception and do not proceed to onos
             # configuration.
@@ -229,10 +337,35 @@ class SyncOLTDevice(SyncStep):
             # At this point OLT is enabled and active. Configure ONOS.
             self.configure_onos(model)
 
+    def wait_for_disabled(self, voltha, model):
+        """
+        Wait until VOLTHA reports the OLT as disabled, or disable_timeout expires.
+        :return: True if the OLT has been disabled in time
+        """
+        deadline = time.time() + self.disable_timeout
+        interval = self.disable_poll_interval
+
+        while True:
+            request = voltha.get_device(model.device_id)
+
+            if request.status_code == 200:
+                device = request.json()
+                if device["admin_state"] == "DISABLED" and device["oper_status"] != "ACTIVE":
+                    return True
+
+            if time.time() + interval > deadline:
+                log.warning("OLT device has not been disabled in %s seconds, deleting it anyway"
+                            % self.disable_timeout, name=model.name, device_id=model.device_id)
+                return False
+
+            log.info("Waiting for OLT device %s (%s) to be disabled" % (model.name, model.device_id))
+            sleep(interval)
+            interval = min(interval * 2, self.disable_poll_max_interval)
+
     def delete_record(self, model):
         log.info("Deleting OLT device", object=str(model), **model.tologdict())
 
-        voltha = Helpers.get_voltha_info(model.volt_service)
+        voltha = VolthaClient.for_service(model.volt_service)
 
         if not model.device_id or model.backend_code == 2:
             # NOTE if the device was not synchronized, just remove it from the data model
@@ -241,20 +374,17 @@ class SyncOLTDevice(SyncStep):
         else:
             try:
                 # Disable the OLT device
-                request = requests.post("%s:%d/api/v1/devices/%s/disable" % (voltha['url'], voltha['port'], model.device_id))
+                request = voltha.disable(model.device_id)
 
                 if request.status_code != 200:
                     log.error("Failed to disable OLT device in VOLTHA: %s - %s" % (model.name, model.device_id), rest_response=request.text, rest_status_code=request.status_code)
                     raise Exception("Failed to disable OLT device in VOLTHA")
 
-                # NOTE [teo] wait some time after the disable to let VOLTHA doing its things
-                i = 0
-                for i in list(reversed(range(10))):
-                    sleep(1)
-                    log.info("Deleting the OLT in %s seconds" % i)
+                # NOTE [teo] wait for the disable to complete to let VOLTHA doing its things
+                self.wait_for_disabled(voltha, model)
 
                 # Delete the OLT device
-                request = requests.delete("%s:%d/api/v1/devices/%s/delete" % (voltha['url'], voltha['port'], model.device_id))
+                request = voltha.delete(model.device_id)
 
                 if request.status_code != 200:
                     log.error("Failed to delete OLT device from VOLTHA: %s - %s" % (model.name, model.device_id), rest_response=request.text, rest_status_code=request.status_code)
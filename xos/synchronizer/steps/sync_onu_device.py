@@ -15,11 +15,9 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers import Helpers
+from voltha_client import VolthaClient
 
-import requests
 from multistructlog import create_logger
-from requests.auth import HTTPBasicAuth
 from xossynchronizer.modelaccessor import ONUDevice, model_accessor
 from xossynchronizer.steps.syncstep import SyncStep
 from xosconfig import Config
@@ -33,20 +31,20 @@ class SyncONUDevice(SyncStep):
 
     def disable_onu(self, o):
         volt_service = o.pon_port.olt_device.volt_service
-        voltha = Helpers.get_voltha_info(volt_service)
+        voltha = VolthaClient.for_service(volt_service)
 
         log.info("Disabling device %s in voltha" % o.device_id)
-        request = requests.post("%s:%d/api/v1/devices/%s/disable" % (voltha['url'], voltha['port'], o.device_id))
+        request = voltha.disable(o.device_id)
 
         if request.status_code != 200:
             raise Exception("Failed to disable ONU device %s: %s" % (o.serial_number, request.text))
 
     def enable_onu(self, o):
         volt_service = o.pon_port.olt_device.volt_service
-        voltha = Helpers.get_voltha_info(volt_service)
+        voltha = VolthaClient.for_service(volt_service)
 
         log.info("Enabling device %s in voltha" % o.device_id)
-        request = requests.post("%s:%d/api/v1/devices/%s/enable" % (voltha['url'], voltha['port'], o.device_id))
+        request = voltha.enable(o.device_id)
 
         if request.status_code != 200:
             raise Exception("Failed to enable ONU device %s: %s" % (o.serial_number, request.text))
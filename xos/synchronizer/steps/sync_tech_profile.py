@@ -12,23 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import re
+import threading
+import time
+
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers import Helpers
-import requests
+from etcd_client import EtcdClient
+from technology_profiles import TechnologyProfileIndex
 from multistructlog import create_logger
-from requests.auth import HTTPBasicAuth
-from xossynchronizer.modelaccessor import TechnologyProfile, model_accessor
+from xossynchronizer.modelaccessor import TechnologyProfile, VOLTService, model_accessor
 from xossynchronizer.steps.syncstep import SyncStep
 from xosconfig import Config
-import etcd3
 
-# TODO store ETCD_HOST_URL and ETCD_PORT in the vOLT Service model
+# used when there is no vOLT Service yet
 ETCD_HOST_URL = 'etcd-cluster.default.svc.cluster.local'
 ETCD_PORT = 2379
 PREFIX = "service/voltha/technology_profiles"
 
+# the keys of the technology profiles, VOLTHA stores other data (ie: the profile instances) under the same prefix
+TP_KEY = re.compile(r"^%s/[^/]+/\d+$" % re.escape(PREFIX))
+
 log = create_logger(Config().get("logging"))
 
 
@@ -37,38 +43,206 @@ class SyncTechnologyProfile(SyncStep):
 
     observes = TechnologyProfile
 
+    # the technology profiles in ETCD are reconciled with XOS at startup, then they are watched and any change made by
+    # somebody else is reverted. Only when the watch can't be established, they are reconciled every reconcile_interval
+    # seconds instead.
+    reconcile_interval = 600
+
+    _lock = threading.Lock()
+    _reconciled_at = 0
+    _values = {}  # ETCD key -> technology profile written in ETCD by XOS
+    _watching = None  # the EtcdClient watching the technology profiles
+    _etcd = None  # the EtcdClient of the current sync cycle
+
+    @staticmethod
+    def tp_key(model):
+        return u'/' + model.technology + u'/' + str(model.profile_id)
+
+    @staticmethod
+    def hash(value):
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        return hashlib.sha1(value).hexdigest()
+
+    @classmethod
+    def written(cls, key, value=None):
+        # NOTE this is recorded before writing to ETCD, so that the watch recognizes the change as ours
+        with cls._lock:
+            if value is None:
+                cls._values.pop(key, None)
+            else:
+                cls._values[key] = value
+
+    def get_etcd(self):
+        """
+        Return the EtcdClient of the vOLTService, resolved once per sync cycle (ie: in fetch_pending).
+        """
+        with SyncTechnologyProfile._lock:
+            etcd = SyncTechnologyProfile._etcd
+
+        if etcd is None:
+            etcd = self.find_etcd()
+            with SyncTechnologyProfile._lock:
+                SyncTechnologyProfile._etcd = etcd
+
+        return etcd
+
+    def find_etcd(self):
+        volt_services = VOLTService.objects.all()
+
+        if len(volt_services) == 0:
+            log.warning("Cannot find a vOLT Service, using the default ETCD", host=ETCD_HOST_URL, port=ETCD_PORT)
+            return EtcdClient.for_endpoint(ETCD_HOST_URL, ETCD_PORT)
+
+        return EtcdClient.for_service(volt_services[0])
+
     def update_etcd(self, operation, key, value=None):
         log.info('Update Etcd store: ', operation=operation, key=PREFIX + key, value=value)
-        etcd = etcd3.client(host=ETCD_HOST_URL, port=ETCD_PORT)
+        etcd = self.get_etcd()
         if operation == 'PUT':
-            etcd.put(PREFIX + key, value)
+            self.written(PREFIX + key, value)
+            try:
+                etcd.put(PREFIX + key, value)
+            except Exception:
+                self.written(PREFIX + key)
+                raise
             log.info('Technology Profile [%s] saved successfully to Etcd store' % (PREFIX + key))
         elif operation == 'GET':
             return etcd.get(PREFIX + key)
         elif operation == 'DELETE':
-            if False == etcd.delete(PREFIX + key):
-                log.error('Error while deleting Technology Profile [%s] from Etcd store' % key)
-                raise Exception('Failed to delete Technology Profile')
-            else:
+            self.written(PREFIX + key)
+            if etcd.delete(PREFIX + key):
                 log.info('Technology Profile [%s] deleted successfully from Etcd store' % key)
+            else:
+                log.info('Technology Profile [%s] was not in the Etcd store' % key)
         else:
             log.warning('Invalid or unsupported Etcd operation: %s' % operation)
 
+    def reconcile(self):
+        """
+        Reconcile the technology profiles in ETCD with XOS: all the profiles are read with a single request, then the
+        ones that are missing or different are written, and the ones that are not in XOS anymore are deleted, in a
+        single transaction.
+        """
+        etcd = self.get_etcd()
+
+        current = dict((k, self.hash(v)) for (k, v) in etcd.get_prefix(PREFIX).items() if TP_KEY.match(k))
+        desired = dict((PREFIX + self.tp_key(tp), tp.profile_value) for tp in TechnologyProfile.objects.all())
+
+        puts = dict((k, v) for (k, v) in desired.items() if current.get(k) != self.hash(v))
+        deletes = [k for k in current if k not in desired]
+
+        # NOTE recorded before writing to ETCD, so that the watch recognizes the changes as ours
+        with SyncTechnologyProfile._lock:
+            (previous, SyncTechnologyProfile._values) = (SyncTechnologyProfile._values, desired)
+
+        if puts or deletes:
+            try:
+                etcd.transaction(puts=puts, deletes=deletes)
+            except Exception:
+                with SyncTechnologyProfile._lock:
+                    SyncTechnologyProfile._values = previous
+                raise
+
+        with SyncTechnologyProfile._lock:
+            SyncTechnologyProfile._reconciled_at = time.time()
+
+        log.info("Technology profiles reconciled with Etcd store", written=sorted(puts.keys()),
+                 deleted=sorted(deletes), unchanged=len(desired) - len(puts))
+
+    def watch(self):
+        """
+        Watch the technology profiles in ETCD, unless they are already watched.
+        """
+        etcd = self.get_etcd()
+
+        with SyncTechnologyProfile._lock:
+            if SyncTechnologyProfile._watching is etcd:
+                return
+            SyncTechnologyProfile._watching = etcd
+
+        try:
+            etcd.watch_prefix(PREFIX, lambda event: self.on_etcd_event(etcd, event))
+        except Exception:
+            with SyncTechnologyProfile._lock:
+                SyncTechnologyProfile._watching = None
+            raise
+
+        log.info("Watching technology profiles in Etcd store", host=etcd.host, port=etcd.port)
+
+    @classmethod
+    def on_etcd_event(cls, etcd, event):
+        """
+        Write again the technology profile XOS owns when somebody else changes or deletes it.
+        """
+        if isinstance(event, Exception):
+            # the changes made while the watch was down are found by reconciling
+            log.warning("Lost the watch on the technology profiles in Etcd store", reason=event)
+            with cls._lock:
+                if cls._watching is etcd:
+                    cls._watching = None
+                cls._reconciled_at = 0
+            return
+
+        with cls._lock:
+            value = cls._values.get(event.key)
+
+        # NOTE a deleted key has an empty value
+        if value is None or cls.hash(event.value) == cls.hash(value):
+            return
+
+        log.warning("Technology Profile [%s] has been changed in Etcd store, writing it again" % event.key)
+        try:
+            etcd.put(event.key, value)
+        except Exception, e:
+            log.exception("Failed to write the Technology Profile [%s] to Etcd store" % event.key, e=e)
+            with cls._lock:
+                cls._reconciled_at = 0
+
+    def fetch_pending(self, deletion=False):
+        models = super(SyncTechnologyProfile, self).fetch_pending(deletion)
+
+        # the vOLTService may have been changed since the last cycle
+        with SyncTechnologyProfile._lock:
+            SyncTechnologyProfile._etcd = None
+
+        if deletion:
+            return models
+
+        try:
+            with SyncTechnologyProfile._lock:
+                reconcile = not SyncTechnologyProfile._reconciled_at or \
+                            (not SyncTechnologyProfile._watching and
+                             time.time() - SyncTechnologyProfile._reconciled_at > self.reconcile_interval)
+
+            if reconcile:
+                self.reconcile()
+
+            self.watch()
+        except Exception, e:
+            log.exception("Failed to reconcile the technology profiles with Etcd store", e=e)
+
+        return models
+
     def sync_record(self, model):
 
         log.info('Synching TechnologyProfile', object=str(model), **model.tologdict())
 
         log.info('TechnologyProfile: %s : %s' % (model.technology, model.profile_id))
 
-        tp_key = u'/' + model.technology + u'/' + str(model.profile_id)
-        self.update_etcd('PUT', tp_key, value=model.profile_value)
+        # NOTE the profile is always written, so that a resync repairs ETCD even if the watch missed a change
+        self.update_etcd('PUT', self.tp_key(model), value=model.profile_value)
+
+    def after_sync_save(self, model):
+        # let the OLTs waiting for a profile of this technology know it's there
+        TechnologyProfileIndex.mark_ready(model.technology)
 
     def delete_record(self, model):
         log.info('Deleting TechnologyProfile', object=str(model), **model.tologdict())
 
         log.info('TechnologyProfile: %s : %s' % (model.technology, model.profile_id))
 
-        tp_key = "/%s/%s" % (model.technology, model.profile_id)
-        [existing_tp, metadata] = self.update_etcd('GET', tp_key)
-        if existing_tp is not None:
-            self.update_etcd('DELETE', tp_key)
+        self.update_etcd('DELETE', self.tp_key(model))
+
+        # other profiles may be there for the same technology, reload them from XOS
+        TechnologyProfileIndex.clear()
@@ -12,34 +12,63 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+from multiprocessing.pool import ThreadPool
+
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from helpers import Helpers
+from onos_client import OnosClient
+from subscriber_replay import SubscriberReplay
 
-import requests
 from multistructlog import create_logger
-from requests.auth import HTTPBasicAuth
-from xossynchronizer.modelaccessor import VOLTService, VOLTServiceInstance, ServiceInstance, model_accessor
+from xossynchronizer.modelaccessor import VOLTService, VOLTServiceInstance, ONUDevice, PONPort, model_accessor
 from xossynchronizer.steps.syncstep import SyncStep, DeferredException
 from xosconfig import Config
 
 log = create_logger(Config().get("logging"))
 
+
+class SubscriberBatch(object):
+    """
+    The pending subscribers of an OLT. They are added to ONOS together, by the first of them being synchronized, and
+    each of them then reports its own outcome from sync_record.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self.errors = None  # VOLTServiceInstance id -> the exception raised while synchronizing it, if any
+        self.lock = threading.Lock()
+
+    def provision(self, step):
+        """
+        Add the subscribers of the batch to ONOS, unless it's been done already.
+        :return: dict - VOLTServiceInstance id -> the exception raised while synchronizing it, if any
+        """
+        with self.lock:
+            if self.errors is None:
+                self.errors = step.provision_batch(self.models)
+            return self.errors
+
+
 class SyncVOLTServiceInstance(SyncStep):
     provides = [VOLTServiceInstance]
 
     observes = VOLTServiceInstance
 
-    def sync_record(self, o):
+    # maximum number of subscribers of an OLT being added to ONOS at the same time
+    max_concurrent_requests = 8
 
-        if o.policy_code != 1:
-            raise DeferredException("Waiting for ModelPolicy to complete")
+    _lock = threading.Lock()
+    _batches = {}  # VOLTServiceInstance id -> SubscriberBatch of its OLT, for the models fetched in this cycle
 
-        volt_service = VOLTService.objects.get(id=o.owner_id)
-
-        log.info("Synching OLTServiceInstance", object=str(o), **o.tologdict())
+    _programmed_lock = threading.Lock()
+    _programmed = {}  # OnosClient -> handles of the subscribers programmed in its OLT app, read once per cycle
 
+    def get_handle(self, o):
+        """
+        Return the handle of the subscriber in ONOS (<dp_id>/<uni port number>), if it can be provisioned already.
+        """
         olt_device = o.onu_device.pon_port.olt_device
 
         try:
@@ -57,39 +86,168 @@ class SyncVOLTServiceInstance(SyncStep):
                  dp_id = olt_device.dp_id
         )
 
-        # Send request to ONOS
-        onos_voltha = Helpers.get_onos_voltha_info(volt_service)
-        onos_voltha_basic_auth = HTTPBasicAuth(onos_voltha['user'], onos_voltha['pass'])
-
-        handle = "%s/%s" % (olt_device.dp_id, uni_port_id)
+        return "%s/%s" % (olt_device.dp_id, uni_port_id)
 
-        full_url = "%s:%d/onos/olt/oltapp/%s" % (onos_voltha['url'], onos_voltha['port'], handle)
+    def add_subscriber(self, volt_service, handle):
+        """
+        Add the subscriber to onos-voltha.
+        """
+        onos = OnosClient.for_service(volt_service)
 
-        log.info("Sending request to onos-voltha", url=full_url)
+        log.info("Sending request to onos-voltha", url="%s/olt/oltapp/%s" % (onos.base_url, handle))
 
-        request = requests.post(full_url, auth=onos_voltha_basic_auth)
+        request = onos.add_subscriber(handle)
 
         if request.status_code != 200:
             raise Exception("Failed to add subscriber in onos-voltha: %s" % request.text)
 
-        o.backend_handle = handle
-        o.save(update_fields=["backend_handle"])
-
         log.info("Added Subscriber in onos voltha", response=request.text)
-    
+
+    def programmed_subscribers(self, onos):
+        """
+        Return the handles of the subscribers programmed in the OLT app of onos, ie: restored by ONOS from its own
+        store after a restart. They are read once per cycle.
+        :return: set - the handles, or None if they can't be read
+        """
+        with SyncVOLTServiceInstance._programmed_lock:
+            if onos not in SyncVOLTServiceInstance._programmed:
+                try:
+                    request = onos.programmed_subscribers()
+                    if request.status_code != 200:
+                        raise Exception("status code %s: %s" % (request.status_code, request.text))
+                    programmed = OnosClient.parse_programmed_subscribers(request.json())
+                except Exception, e:
+                    log.warning("Unable to read the programmed subscribers from onos-voltha, adding all of them",
+                                url=onos.base_url, reason=e)
+                    programmed = None
+
+                SyncVOLTServiceInstance._programmed[onos] = programmed
+
+            return SyncVOLTServiceInstance._programmed[onos]
+
+    def provision_batch(self, models):
+        """
+        Add the subscribers of an OLT to ONOS, with up to max_concurrent_requests requests in flight, then write back
+        the backend_handles that changed. The subscribers already programmed in ONOS are not added again.
+        :return: dict - VOLTServiceInstance id -> the exception raised while synchronizing it, if any
+        """
+        errors = {}
+        volt_services = {}
+        to_add = []
+
+        for o in models:
+            try:
+                if o.policy_code != 1:
+                    raise DeferredException("Waiting for ModelPolicy to complete")
+
+                if o.owner_id not in volt_services:
+                    volt_services[o.owner_id] = VOLTService.objects.get(id=o.owner_id)
+
+                to_add.append((o, volt_services[o.owner_id], self.get_handle(o)))
+            except Exception, e:
+                errors[o.id] = e
+
+        def add(subscriber):
+            (o, volt_service, handle) = subscriber
+            try:
+                programmed = self.programmed_subscribers(OnosClient.for_service(volt_service))
+                if programmed is not None and handle in programmed:
+                    log.debug("Subscriber is already programmed in onos-voltha", handle=handle)
+                    return
+
+                self.add_subscriber(volt_service, handle)
+            except Exception, e:
+                return e
+
+        if len(to_add) > 1:
+            pool = ThreadPool(min(self.max_concurrent_requests, len(to_add)))
+            try:
+                results = pool.map(add, to_add)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(add, to_add)
+
+        for ((o, volt_service, handle), error) in zip(to_add, results):
+            if error:
+                errors[o.id] = error
+            elif o.backend_handle != handle:
+                o.backend_handle = handle
+                o.save(update_fields=["backend_handle"])
+
+        log.info("Added subscribers in onos-voltha", subscribers=len(models), failed=len(errors))
+
+        return errors
+
+    @staticmethod
+    def olts_of_onus():
+        """
+        Return the OLTDevice id of every ONUDevice id, loaded with two queries instead of walking the models of every
+        subscriber.
+        """
+        olt_of_pon_port = dict((p.id, p.olt_device_id) for p in PONPort.objects.all())
+        return dict((onu.id, olt_of_pon_port.get(onu.pon_port_id)) for onu in ONUDevice.objects.all())
+
+    @staticmethod
+    def replay_order(olt_of_onu):
+        """
+        Return the sort key of the subscribers being replayed, so that they are replayed one OLT after the other.
+        """
+        return lambda o: (olt_of_onu.get(o.onu_device_id), o.id)
+
+    def fetch_pending(self, deletion=False):
+        models = super(SyncVOLTServiceInstance, self).fetch_pending(deletion)
+
+        if not deletion:
+            olt_of_onu = self.olts_of_onus() if models else {}
+
+            # the subscribers replayed after a restart of ONOS are only let through at SubscriberReplay.rate
+            models = SubscriberReplay.admit(models, key=self.replay_order(olt_of_onu))
+
+            # the subscribers are added to ONOS one OLT at a time, from sync_record, see SubscriberBatch
+            by_olt = {}
+            for o in models:
+                by_olt.setdefault(olt_of_onu.get(o.onu_device_id), []).append(o)
+
+            batches = {}
+            for olt_models in by_olt.values():
+                batch = SubscriberBatch(olt_models)
+                for o in olt_models:
+                    batches[o.id] = batch
+
+            with SyncVOLTServiceInstance._lock:
+                SyncVOLTServiceInstance._batches = batches
+
+            with SyncVOLTServiceInstance._programmed_lock:
+                SyncVOLTServiceInstance._programmed = {}
+
+        return models
+
+    def sync_record(self, o):
+
+        log.info("Synching OLTServiceInstance", object=str(o), **o.tologdict())
+
+        with SyncVOLTServiceInstance._lock:
+            batch = SyncVOLTServiceInstance._batches.get(o.id)
+
+        # a subscriber that was not fetched in this cycle is synchronized on its own
+        if batch is None:
+            batch = SubscriberBatch([o])
+
+        error = batch.provision(self).get(o.id)
+        if error:
+            raise error
+
     def delete_record(self, o):
 
         log.info("Removing OLTServiceInstance", object=str(o), **o.tologdict())
 
         volt_service = VOLTService.objects.get(id=o.owner_id)
-        onos_voltha = Helpers.get_onos_voltha_info(volt_service)
-        onos_voltha_basic_auth = HTTPBasicAuth(onos_voltha['user'], onos_voltha['pass'])
-
-        full_url = "%s:%d/onos/olt/oltapp/%s" % (onos_voltha['url'], onos_voltha['port'], o.backend_handle)
 
-        request = requests.delete(full_url, auth=onos_voltha_basic_auth)
+        request = OnosClient.for_service(volt_service).remove_subscriber(o.backend_handle)
 
         if request.status_code != 204:
             raise Exception("Failed to remove subscriber from onos-voltha: %s" % request.text)
 
-        log.info("Removed Subscriber from onos voltha", response=request.text)
\ No newline at end of file
+        log.info("Removed Subscriber from onos voltha", response=request.text)
@@ -15,6 +15,7 @@
 from requests import ConnectionError
 import unittest
 import functools
+import time
 from mock import patch, call, Mock, PropertyMock
 import requests_mock
 
@@ -30,7 +31,7 @@ def match_json(desired, req):
 
 class TestSyncOLTDevice(unittest.TestCase):
     def setUp(self):
-        global DeferredException
+        global DeferredException, OLTAttachmentIndex
         self.sys_path_save = sys.path
 
         # Setting up the config module
@@ -54,9 +55,27 @@ class TestSyncOLTDevice(unittest.TestCase):
         for (k, v) in model_accessor.all_model_classes.items():
             globals()[k] = v
 
-        from sync_olt_device import SyncOLTDevice, DeferredException
+        from sync_olt_device import SyncOLTDevice, DeferredException, OLTAttachmentIndex
         self.sync_step = SyncOLTDevice
 
+        # the logical device index is shared across steps, make sure every test builds its own
+        from voltha_inventory import LogicalDeviceIndex
+        LogicalDeviceIndex.clear()
+
+        # as well as the ONOS network configuration
+        from onos_netcfg import OnosNetworkConfig
+        OnosNetworkConfig.clear()
+        self.onos_netcfg = OnosNetworkConfig
+
+        from onos_client import OnosClient
+        OnosClient.clear()
+        self.onos_client = OnosClient
+
+        # and the technology profiles
+        from technology_profiles import TechnologyProfileIndex
+        TechnologyProfileIndex.clear()
+        self.tp_index = TechnologyProfileIndex
+
         pon_port = Mock()
         pon_port.port_id = "00ff00"
 
@@ -84,6 +103,7 @@ class TestSyncOLTDevice(unittest.TestCase):
         o.driver = "voltha"
         o.name = "Test Device"
         o.admin_state = "ENABLED"
+        o.technology = "xgspon"
 
         # feedback state
         o.device_id = None
@@ -91,6 +111,7 @@ class TestSyncOLTDevice(unittest.TestCase):
         o.serial_number= None
         o.of_id = None
         o.id = 1
+        o.activation_started = None
 
         o.tologdict.return_value = {'name': "Mock VOLTServiceInstance"}
 
@@ -121,6 +142,7 @@ class TestSyncOLTDevice(unittest.TestCase):
             ]
         }
         m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=logical_devices)
+        m.get("http://voltha_url:1234/api/v1/devices/idonotexist", status_code=404, json={})
         self.o.device_id = "123"
         self.o = self.sync_step.get_ids_from_logical_device(self.o)
         self.assertEqual(self.o.of_id, "0001000ce2314000")
@@ -131,6 +153,11 @@ class TestSyncOLTDevice(unittest.TestCase):
             self.sync_step.get_ids_from_logical_device(self.o)
         self.assertEqual(e.exception.message, "Can't find a logical_device for OLT device id: idonotexist")
 
+        # the logical device list is downloaded once, then only the missing device is looked up
+        urls = [x.url for x in m.request_history]
+        self.assertEqual(urls, ["http://voltha_url:1234/api/v1/logical_devices",
+                                "http://voltha_url:1234/api/v1/devices/idonotexist"])
+
     @requests_mock.Mocker()
     def test_sync_record_fail_add(self, m):
         """
@@ -139,8 +166,8 @@ class TestSyncOLTDevice(unittest.TestCase):
         m.post("http://voltha_url:1234/api/v1/devices", status_code=500, text="MockError")
 
         with self.assertRaises(Exception) as e, \
-            patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+            patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
 
@@ -154,8 +181,8 @@ class TestSyncOLTDevice(unittest.TestCase):
         m.post("http://voltha_url:1234/api/v1/devices", status_code=200, json={"id": ""})
 
         with self.assertRaises(Exception) as e, \
-            patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+            patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
 
@@ -170,8 +197,8 @@ class TestSyncOLTDevice(unittest.TestCase):
         m.post("http://voltha_url:1234/api/v1/devices/123/enable", status_code=500, text="EnableError")
 
         with self.assertRaises(Exception) as e, \
-            patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+            patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
 
@@ -211,8 +238,8 @@ class TestSyncOLTDevice(unittest.TestCase):
         m.post("http://onos:4321/onos/v1/network/configuration/", status_code=200, json=onos_expected_conf,
                additional_matcher=functools.partial(match_json, onos_expected_conf))
 
-        with patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
             self.assertEqual(self.o.admin_state, "ENABLED")
@@ -264,8 +291,8 @@ class TestSyncOLTDevice(unittest.TestCase):
         }
         m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=logical_devices)
 
-        with patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
             self.assertEqual(self.o.admin_state, "ENABLED")
@@ -277,13 +304,87 @@ class TestSyncOLTDevice(unittest.TestCase):
             # One save after activation has succeeded
             self.assertEqual(self.o.save_changed_fields.call_count, 3)
 
+    @requests_mock.Mocker()
+    def test_sync_record_enable_activating(self, m):
+        """
+        If the device is activating, the sync step should not wait for it.
+
+        OLT will be preprovisioned and enabled.
+        OLT will return "ACTIVATING" for oper_status, the sync step will be deferred.
+        On the next pass the OLT is not enabled again, and it will return "ACTIVE".
+        """
+
+        m.post("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.voltha_devices_response)
+        m.post("http://voltha_url:1234/api/v1/devices/123/enable", status_code=200)
+        m.get("http://voltha_url:1234/api/v1/devices/123", [
+                  {"json": {"oper_status": "ACTIVATING", "admin_state": "ENABLED", "serial_number": "foobar"}, "status_code": 200},
+                  {"json": {"oper_status": "ACTIVE", "admin_state": "ENABLED", "serial_number": "foobar"},
+                   "status_code": 200}
+              ])
+
+        logical_devices = {
+            "items": [
+                {"root_device_id": "123", "id": "0001000ce2314000", "datapath_id": "55334486016"},
+            ]
+        }
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=logical_devices)
+        m.post("http://onos:4321/onos/v1/network/configuration/", status_code=200, json={})
+
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
+
+            with self.assertRaises(DeferredException) as e:
+                self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+            self.assertEqual(e.exception.message, "Waiting for OLT device Test Device (123) to activate")
+            self.assertEqual(self.o.oper_status, "ACTIVATING")
+            self.assertIsNotNone(self.o.activation_started)
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+        self.assertEqual(self.o.oper_status, "ACTIVE")
+        self.assertIsNone(self.o.activation_started)
+        self.assertEqual(self.o.of_id, "0001000ce2314000")
+
+        # the device has been enabled only once
+        enable_requests = [r for r in m.request_history if r.path.endswith("/enable")]
+        self.assertEqual(len(enable_requests), 1)
+
     @requests_mock.Mocker()
     def test_sync_record_enable_timeout(self, m):
         """
         If device activation fails we need to tell the user.
 
+        OLT will be activating since longer than the activation timeout.
+        """
+
+        self.o.device_id = "123"
+        self.o.oper_status = "ACTIVATING"
+        self.o.activation_started = time.time() - self.sync_step.activation_timeout - 1
+
+        m.get("http://voltha_url:1234/api/v1/devices/123", status_code=200,
+              json={"oper_status": "ACTIVATING", "admin_state": "ENABLED", "serial_number": "foobar"})
+
+        with self.assertRaises(Exception) as e, \
+            patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+        self.assertEqual(e.exception.message, "It was not possible to activate OLTDevice with id 1")
+        self.assertEqual(self.o.oper_status, "ACTIVATING")
+        self.assertIsNone(self.o.activation_started)
+
+        # the device has not been enabled again
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_sync_record_enable_error(self, m):
+        """
+        If device activation fails we need to tell the user.
+
         OLT will be preprovisioned.
-        OLT will return "ERROR" for oper_status during activate and will eventually exceed retries.s
+        OLT will return "ACTIVATING" for oper_status, and then "ERROR".
         """
 
         expected_conf = {
@@ -307,21 +408,26 @@ class TestSyncOLTDevice(unittest.TestCase):
         }
         m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=logical_devices)
 
-        with self.assertRaises(Exception) as e, \
-            patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
-            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+            with self.assertRaises(DeferredException):
+                self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+            with self.assertRaises(Exception) as e:
+                self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
 
         self.assertEqual(e.exception.message, "It was not possible to activate OLTDevice with id 1")
         self.assertEqual(self.o.oper_status, "ERROR")
         self.assertEqual(self.o.admin_state, "ENABLED")
         self.assertEqual(self.o.device_id, "123")
         self.assertEqual(self.o.serial_number, "foobar")
+        self.assertIsNone(self.o.activation_started)
 
         # One save from preprovision to set device_id, serial_number
         # One save from activate to set backend_status to "Waiting for device to be activated"
-        self.assertEqual(self.o.save_changed_fields.call_count, 2)
+        # One save from activate to reset the activation
+        self.assertEqual(self.o.save_changed_fields.call_count, 3)
 
     @requests_mock.Mocker()
     def test_sync_record_already_existing_in_voltha(self, m):
@@ -348,13 +454,125 @@ class TestSyncOLTDevice(unittest.TestCase):
         m.post("http://onos:4321/onos/v1/network/configuration/", status_code=200, json=expected_conf,
                additional_matcher=functools.partial(match_json, expected_conf))
 
-        with patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
             self.o.save.assert_not_called()
             self.o.save_changed_fields.assert_not_called()
 
+    @requests_mock.Mocker()
+    def test_sync_record_active_clears_activation(self, m):
+        """
+        An OLT found ACTIVE by the pull step while activating is not considered activating anymore
+        """
+
+        self.o.device_id = "123"
+        self.o.admin_state = "ENABLED"
+        self.o.oper_status = "ACTIVE"
+        self.o.dp_id = "of:0000000ce2314000"
+        self.o.of_id = "0001000ce2314000"
+        self.o.activation_started = time.time() - 10
+
+        m.post("http://onos:4321/onos/v1/network/configuration/", status_code=200)
+
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+        self.assertIsNone(self.o.activation_started)
+        self.o.save_changed_fields.assert_called_once_with(always_update_timestamp=False)
+
+    @requests_mock.Mocker()
+    def test_sync_record_already_configured_in_onos(self, m):
+        """
+        If the OLT is already in the ONOS network configuration, the configuration is not pushed again.
+        """
+
+        self.o.device_id = "123"
+        self.o.admin_state = "ENABLED"
+        self.o.oper_status = "ACTIVE"
+        self.o.dp_id = "of:0000000ce2314000"
+        self.o.of_id = "0001000ce2314000"
+
+        onos_devices = {
+            self.o.dp_id: {
+                "basic": {
+                    "name": self.o.name,
+                    "driver": "voltha"
+                }
+            }
+        }
+        m.get("http://onos:4321/onos/v1/network/configuration/devices", status_code=200, json=onos_devices)
+        m.post("http://onos:4321/onos/v1/network/configuration/", status_code=200)
+
+        self.onos_netcfg.refresh(self.onos_client.for_service(self.o.volt_service))
+
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(m.request_history[0].method, "GET")
+
+    @requests_mock.Mocker()
+    def test_configure_onos_batch(self, m):
+        """
+        The configuration of the active OLTs that ONOS doesn't have yet is pushed with a single request, by the first
+        of them being synchronized. Nothing is requested from ONOS while fetching the pending OLTs.
+        """
+
+        def mock_olt(id, name, dp_id, admin_state="ENABLED", oper_status="ACTIVE"):
+            olt = Mock()
+            olt.id = id
+            olt.name = name
+            olt.dp_id = dp_id
+            olt.admin_state = admin_state
+            olt.oper_status = oper_status
+            olt.volt_service = self.o.volt_service
+            olt.volt_service_id = 1
+            olt.tologdict.return_value = {}
+            return olt
+
+        configured = mock_olt(1, "configured", "of:0000000000000001")
+        renamed = mock_olt(2, "renamed", "of:0000000000000002")
+        new = mock_olt(3, "new", "of:0000000000000003")
+        activating = mock_olt(4, "activating", None, oper_status="ACTIVATING")
+        disabled = mock_olt(5, "disabled", "of:0000000000000005", admin_state="DISABLED")
+
+        onos_devices = {
+            configured.dp_id: {"basic": {"name": "configured"}},
+            renamed.dp_id: {"basic": {"name": "old name"}},
+        }
+        read = m.get("http://onos:4321/onos/v1/network/configuration/devices", status_code=200, json=onos_devices)
+
+        expected_conf = {
+            "devices": {
+                renamed.dp_id: {"basic": {"name": "renamed"}},
+                new.dp_id: {"basic": {"name": "new"}},
+            }
+        }
+        push = m.post("http://onos:4321/onos/v1/network/configuration/", status_code=200,
+                      additional_matcher=functools.partial(match_json, expected_conf))
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+        with patch.object(self.model_accessor, "fetch_pending") as fetch_pending:
+            fetch_pending.return_value = [configured, renamed, new, activating, disabled]
+
+            self.assertEqual(step.fetch_pending(), [configured, renamed, new, activating, disabled])
+
+        self.assertFalse(m.called)
+
+        for olt in [configured, renamed, new]:
+            step.configure_onos(olt)
+
+        # the OLTs are now all configured in ONOS, the sync of each one doesn't push anything
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(push.call_count, 1)
+        self.assertEqual(m.call_count, 2)
+
     @requests_mock.Mocker()
     def test_sync_record_deactivate(self, m):
         """
@@ -376,8 +594,8 @@ class TestSyncOLTDevice(unittest.TestCase):
         m.post("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.voltha_devices_response, additional_matcher=functools.partial(match_json, expected_conf))
         m.post("http://voltha_url:1234/api/v1/devices/123/disable", status_code=200)
 
-        with patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
 
@@ -411,8 +629,8 @@ class TestSyncOLTDevice(unittest.TestCase):
 
         m.post("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.voltha_devices_response, additional_matcher=functools.partial(match_json, expected_conf))
 
-        with patch.object(TechnologyProfile.objects, "get") as tp_mock:
-            tp_mock.return_value = self.tp
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = [self.tp]
 
             self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
 
@@ -429,19 +647,110 @@ class TestSyncOLTDevice(unittest.TestCase):
 
         self.assertEqual(e.exception.message, "Waiting for a TechnologyProfile (technology=xgspon) to be synchronized")
 
+    def test_fetch_pending_waiting_for_tech_profile(self):
+        """
+        OLTs already deferred waiting for a TechnologyProfile are left out, until a profile for their technology is
+        synchronized.
+        """
+
+        def mock_olt(name, technology, backend_status):
+            olt = Mock()
+            olt.name = name
+            olt.technology = technology
+            olt.backend_code = 0
+            olt.backend_status = backend_status
+            olt.admin_state = "DISABLED"
+            return olt
+
+        waiting = mock_olt("waiting", "gpon", "Waiting for a TechnologyProfile (technology=gpon) to be synchronized")
+        new = mock_olt("new", "gpon", None)
+        ready = mock_olt("ready", "xgspon", "Waiting for a TechnologyProfile (technology=xgspon) to be synchronized")
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(self.model_accessor, "fetch_pending") as fetch_pending, \
+            patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            fetch_pending.return_value = [waiting, new, ready]
+            tp_mock.return_value = [self.tp]
+
+            self.assertEqual(step.fetch_pending(), [new, ready])
+
+            # the profiles are read from XOS only once
+            self.assertEqual(step.fetch_pending(), [new, ready])
+            self.assertEqual(tp_mock.call_count, 1)
+
+            # a gpon profile has been synchronized
+            self.tp_index.mark_ready("gpon")
+            self.assertEqual(step.fetch_pending(), [waiting, new, ready])
+            self.assertEqual(tp_mock.call_count, 1)
+
+    def test_fetch_pending_attachments(self):
+        """
+        The fabric ports of the OLTs that changed are recorded, so that their ONOS port events are not dropped.
+        """
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(self.model_accessor, "fetch_pending") as fetch_pending, \
+            patch.object(OLTAttachmentIndex, "update") as update, \
+            patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            fetch_pending.return_value = [self.o]
+            tp_mock.return_value = [self.tp]
+
+            step.fetch_pending()
+            update.assert_called_with([self.o], deleted=False)
+
+            step.fetch_pending(deletion=True)
+            update.assert_called_with([self.o], deleted=True)
+
     @requests_mock.Mocker()
     def test_delete_record(self, m):
         self.o.of_id = "0001000ce2314000"
         self.o.device_id = "123"
 
         m.post("http://voltha_url:1234/api/v1/devices/123/disable", status_code=200)
+        m.get("http://voltha_url:1234/api/v1/devices/123", status_code=200,
+              json={"admin_state": "DISABLED", "oper_status": "UNKNOWN"})
         m.delete("http://voltha_url:1234/api/v1/devices/123/delete", status_code=200)
 
         self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
 
-        self.assertEqual(m.call_count, 2)
+        self.assertEqual(m.call_count, 3)
+
+    @requests_mock.Mocker()
+    def test_delete_record_wait_for_disable(self, m):
+        self.o.of_id = "0001000ce2314000"
+        self.o.device_id = "123"
+
+        m.post("http://voltha_url:1234/api/v1/devices/123/disable", status_code=200)
+        m.get("http://voltha_url:1234/api/v1/devices/123", [
+            {"json": {"admin_state": "ENABLED", "oper_status": "ACTIVE"}, "status_code": 200},
+            {"json": {"admin_state": "DISABLED", "oper_status": "ACTIVE"}, "status_code": 200},
+            {"json": {"admin_state": "DISABLED", "oper_status": "UNKNOWN"}, "status_code": 200},
+        ])
+        m.delete("http://voltha_url:1234/api/v1/devices/123/delete", status_code=200)
+
+        with patch.object(self.sync_step, "disable_poll_interval", 0):
+            self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
+
+        self.assertEqual([r.method for r in m.request_history], ["POST", "GET", "GET", "GET", "DELETE"])
+
+    @requests_mock.Mocker()
+    def test_delete_record_disable_timeout(self, m):
+        self.o.of_id = "0001000ce2314000"
+        self.o.device_id = "123"
+
+        m.post("http://voltha_url:1234/api/v1/devices/123/disable", status_code=200)
+        m.get("http://voltha_url:1234/api/v1/devices/123", status_code=200,
+              json={"admin_state": "ENABLED", "oper_status": "ACTIVE"})
+        m.delete("http://voltha_url:1234/api/v1/devices/123/delete", status_code=200)
+
+        with patch.object(self.sync_step, "disable_timeout", 0):
+            self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
+
+        # the OLT is deleted anyway
+        self.assertEqual([r.method for r in m.request_history], ["POST", "GET", "DELETE"])
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_delete_record_connectionerror(self, m):
         self.o.of_id = "0001000ce2314000"
         self.o.device_id = "123"
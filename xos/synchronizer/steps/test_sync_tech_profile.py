@@ -20,12 +20,21 @@ import os, sys
 
 test_path=os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
 
+class ConnectionFailedError(Exception):
+    pass
+
+class ConnectionTimeoutError(Exception):
+    pass
+
 class TestSyncTechProfile(unittest.TestCase):
     def setUp(self):
 
         self.mock_etcd = Mock(name="etcd-client")
         etcd = Mock(name="etcd-mocked-lib")
         etcd.client.return_value = self.mock_etcd
+        etcd.exceptions.ConnectionFailedError = ConnectionFailedError
+        etcd.exceptions.ConnectionTimeoutError = ConnectionTimeoutError
+        self.etcd = etcd
         modules = {
             'etcd3': etcd
         }
@@ -60,6 +69,10 @@ class TestSyncTechProfile(unittest.TestCase):
 
         self.sync_step = SyncTechnologyProfile
 
+        from technology_profiles import TechnologyProfileIndex
+        TechnologyProfileIndex.clear()
+        self.tp_index = TechnologyProfileIndex
+
         self.o = Mock()
         self.o.technology = "test_technology"
         self.o.profile_id = 64
@@ -78,21 +91,226 @@ class TestSyncTechProfile(unittest.TestCase):
         self.mock_etcd.put.assert_called_with('service/voltha/technology_profiles/test_technology/64',
                                               '{"test":"profile"}')
 
+    def test_ready(self):
+        with patch.object(TechnologyProfile.objects, "filter") as tp_mock:
+            tp_mock.return_value = []
+            self.assertFalse(self.tp_index.is_ready("test_technology"))
+
+            # once synchronized, the technology is ready without asking XOS again
+            self.sync_step(model_accessor=self.model_accessor).after_sync_save(self.o)
+            self.assertTrue(self.tp_index.is_ready("test_technology"))
+            self.assertEqual(tp_mock.call_count, 1)
+
+            # after a deletion the profiles are read again from XOS
+            self.mock_etcd.get.return_value = [self.o.profile_value, "response from mock-etcd"]
+            self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
+            self.assertFalse(self.tp_index.is_ready("test_technology"))
+            self.assertEqual(tp_mock.call_count, 2)
+
+    def test_reconcile(self):
+        def kv(key, value):
+            metadata = Mock()
+            metadata.key = "service/voltha/technology_profiles" + key
+            return (value, metadata)
+
+        self.mock_etcd.get_prefix.return_value = [
+            kv("/test_technology/64", '{"test":"profile"}'),
+            kv("/test_technology/65", '{"old":"profile"}'),
+            kv("/test_technology/66", '{"orphan":"profile"}'),
+            kv("/test_technology/64/pon-{0}/onu-{1}/uni-{1}", '{"instance":"profile"}'),
+        ]
+
+        tps = [
+            TechnologyProfile(technology="test_technology", profile_id=64, profile_value='{"test":"profile"}'),
+            TechnologyProfile(technology="test_technology", profile_id=65, profile_value='{"new":"profile"}'),
+            TechnologyProfile(technology="other_technology", profile_id=64, profile_value='{"other":"profile"}'),
+        ]
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(TechnologyProfile.objects, "get_items") as get_items:
+            get_items.return_value = tps
+
+            step.fetch_pending()
+            # reconciliation happens once per reconcile_interval
+            step.fetch_pending()
+
+        self.mock_etcd.get_prefix.assert_called_once_with("service/voltha/technology_profiles")
+        self.mock_etcd.transaction.assert_called_once()
+
+        puts = sorted(c[0] for c in self.mock_etcd.transactions.put.call_args_list)
+        self.assertEqual(puts, [
+            ("service/voltha/technology_profiles/other_technology/64", '{"other":"profile"}'),
+            ("service/voltha/technology_profiles/test_technology/65", '{"new":"profile"}'),
+        ])
+        self.mock_etcd.transactions.delete.assert_called_once_with(
+            "service/voltha/technology_profiles/test_technology/66")
+
+        # a profile that is already in ETCD is written again when synchronized, ie: by a forced resync
+        step.sync_record(self.o)
+        self.mock_etcd.put.assert_called_once_with('service/voltha/technology_profiles/test_technology/64',
+                                                   '{"test":"profile"}')
+
+    def test_watch(self):
+        self.mock_etcd.get_prefix.return_value = []
+
+        def event(key, value):
+            e = Mock()
+            e.key = "service/voltha/technology_profiles" + key
+            e.value = value
+            return e
+
+        tps = [TechnologyProfile(technology="test_technology", profile_id=64, profile_value='{"test":"profile"}')]
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(TechnologyProfile.objects, "get_items") as get_items:
+            get_items.return_value = tps
+            step.fetch_pending()
+
+        self.assertEqual(self.mock_etcd.add_watch_callback.call_count, 1)
+        (prefix, callback) = self.mock_etcd.add_watch_callback.call_args[0]
+        self.assertEqual(prefix, "service/voltha/technology_profiles")
+        self.mock_etcd.put.reset_mock()
+
+        # our own writes and the keys that XOS doesn't own are left alone
+        callback(event("/test_technology/64", '{"test":"profile"}'))
+        callback(event("/test_technology/65", '{"other":"profile"}'))
+        callback(event("/test_technology/64/pon-{0}/onu-{1}/uni-{1}", '{"instance":"profile"}'))
+        self.mock_etcd.put.assert_not_called()
+
+        # changed or deleted profiles are written again
+        callback(event("/test_technology/64", '{"changed":"profile"}'))
+        callback(event("/test_technology/64", ''))
+        self.assertEqual(self.mock_etcd.put.call_args_list, [
+            call("service/voltha/technology_profiles/test_technology/64", '{"test":"profile"}'),
+            call("service/voltha/technology_profiles/test_technology/64", '{"test":"profile"}'),
+        ])
+
+        # the watch is not created twice
+        step.fetch_pending()
+        self.assertEqual(self.mock_etcd.add_watch_callback.call_count, 1)
+        self.assertEqual(self.mock_etcd.get_prefix.call_count, 1)
+
+    def test_watch_lost(self):
+        self.mock_etcd.get_prefix.return_value = []
+
+        other_etcd = Mock(name="other-etcd-client")
+        other_etcd.get_prefix.return_value = []
+        self.etcd.client.side_effect = [self.mock_etcd, other_etcd]
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+        step.fetch_pending()
+
+        (prefix, callback) = self.mock_etcd.add_watch_callback.call_args[0]
+        callback(ConnectionFailedError())
+
+        # reconciled again, and watched with a new client
+        step.fetch_pending()
+        other_etcd.get_prefix.assert_called_once_with("service/voltha/technology_profiles")
+        self.assertEqual(other_etcd.add_watch_callback.call_count, 1)
+
+    def test_reconcile_failed(self):
+        self.mock_etcd.get_prefix.return_value = []
+        self.mock_etcd.transaction.side_effect = Exception("etcd is down")
+
+        tps = [TechnologyProfile(technology="test_technology", profile_id=64, profile_value='{"test":"profile"}')]
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(TechnologyProfile.objects, "get_items") as get_items:
+            get_items.return_value = tps
+
+            with self.assertRaises(Exception):
+                step.reconcile()
+
+        # the profiles that were not written are not considered in ETCD
+        self.assertNotIn("service/voltha/technology_profiles/test_technology/64", self.sync_step._values)
+
+    def test_reconcile_batches(self):
+        self.mock_etcd.get_prefix.return_value = []
+
+        tps = [TechnologyProfile(technology="test_technology", profile_id=i, profile_value="{}") for i in range(5)]
+
+        from etcd_client import EtcdClient
+        with patch.object(TechnologyProfile.objects, "get_items") as get_items, \
+            patch.object(EtcdClient, "max_txn_ops", 2):
+            get_items.return_value = tps
+
+            self.sync_step(model_accessor=self.model_accessor).reconcile()
+
+        self.assertEqual(self.mock_etcd.transaction.call_count, 3)
+        self.assertEqual(self.mock_etcd.transactions.put.call_count, 5)
+
     def test_delete(self):
 
-        self.mock_etcd.get.return_value = [self.o.profile_value, "response from mock-etcd"]
+        self.mock_etcd.delete.return_value = True
 
         self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
-        self.mock_etcd.get.assert_called_with('service/voltha/technology_profiles/test_technology/64')
-        self.mock_etcd.delete.assert_called_with('service/voltha/technology_profiles/test_technology/64')
+        self.mock_etcd.get.assert_not_called()
+        self.mock_etcd.delete.assert_called_once_with('service/voltha/technology_profiles/test_technology/64')
 
     def test_delete_missing_object(self):
 
-        self.mock_etcd.get.return_value = [None, "response from mock-etcd"]
+        self.mock_etcd.delete.return_value = False
 
         self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
-        self.mock_etcd.get.assert_called_with('service/voltha/technology_profiles/test_technology/64')
-        self.mock_etcd.delete.assert_not_called()
+        self.mock_etcd.get.assert_not_called()
+        self.mock_etcd.delete.assert_called_once_with('service/voltha/technology_profiles/test_technology/64')
+
+    def test_client_reused(self):
+        self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+        self.o.profile_value = '{"test":"changed"}'
+        self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+        self.sync_step(model_accessor=self.model_accessor).delete_record(self.o)
+
+        self.etcd.client.assert_called_once_with(host='etcd-cluster.default.svc.cluster.local', port=2379, timeout=10)
+        self.assertEqual(self.mock_etcd.put.call_count, 2)
+
+    def test_reconnect(self):
+        other_etcd = Mock(name="other-etcd-client")
+        self.etcd.client.side_effect = [self.mock_etcd, other_etcd]
+        self.mock_etcd.put.side_effect = ConnectionFailedError()
+
+        self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+        other_etcd.put.assert_called_with('service/voltha/technology_profiles/test_technology/64',
+                                          '{"test":"profile"}')
+
+        # the new client is kept
+        self.o.profile_value = '{"test":"changed"}'
+        self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+        self.assertEqual(self.etcd.client.call_count, 2)
+        self.assertEqual(other_etcd.put.call_count, 2)
+
+    def test_etcd_from_volt_service(self):
+        volt_service = VOLTService(etcd_url="etcd", etcd_port=1234)
+
+        with patch.object(VOLTService.objects, "get_items") as get_items:
+            get_items.return_value = [volt_service]
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+
+        self.etcd.client.assert_called_once_with(host='etcd', port=1234, timeout=10)
+
+    def test_etcd_once_per_cycle(self):
+        volt_service = VOLTService(etcd_url="etcd", etcd_port=1234)
+        self.mock_etcd.get_prefix.return_value = []
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(VOLTService.objects, "get_items") as get_items, \
+            patch.object(TechnologyProfile.objects, "get_items") as tp_items:
+            get_items.return_value = [volt_service]
+            tp_items.return_value = []
+
+            step.fetch_pending()
+            step.sync_record(self.o)
+            step.delete_record(self.o)
+            self.assertEqual(get_items.call_count, 1)
+
+            # the vOLTService is read again in the next cycle
+            step.fetch_pending()
+            self.assertEqual(get_items.call_count, 2)
 
 
 if __name__ == "__main__":
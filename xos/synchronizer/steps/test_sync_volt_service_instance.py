@@ -53,6 +53,13 @@ class TestSyncVOLTServiceInstance(unittest.TestCase):
 
         self.sync_step = SyncVOLTServiceInstance
 
+        from onos_client import OnosClient
+        OnosClient.clear()
+
+        from subscriber_replay import SubscriberReplay
+        SubscriberReplay.clear()
+        self.replay = SubscriberReplay
+
         # create a mock ONOS Service
         onos = Mock()
         onos.name = "ONOS"
@@ -131,6 +138,212 @@ class TestSyncVOLTServiceInstance(unittest.TestCase):
                 self.assertTrue(m.called)
                 self.assertEqual(e.exception.message, "Failed to add subscriber in onos voltha: Mock Error")
 
+    @requests_mock.Mocker()
+    def test_do_sync_unchanged_handle(self, m):
+
+        self.onu_device.pon_port.olt_device.dp_id = "of:dp_id"
+        self.o.backend_handle = "of:dp_id/uni_port_id"
+
+        m.post("http://onos_voltha_url:4321/onos/olt/oltapp/of:dp_id/uni_port_id", status_code=200, json={})
+
+        with patch.object(VOLTService.objects, "get") as olt_service_mock:
+            olt_service_mock.return_value = self.volt_service
+
+            self.sync_step(model_accessor=self.model_accessor).sync_record(self.o)
+            self.assertTrue(m.called)
+            self.o.save.assert_not_called()
+
+    @staticmethod
+    def mock_subscriber(id, olt_id, dp_id, uni_port_no):
+        uni_port = Mock()
+        uni_port.port_no = uni_port_no
+
+        si = Mock()
+        si.id = id
+        si.onu_device_id = id
+        si.policy_code = 1
+        si.owner_id = "volt_service"
+        si.backend_handle = None
+        si.tologdict.return_value = {}
+        si.onu_device.pon_port.olt_device.id = olt_id
+        si.onu_device.pon_port.olt_device.dp_id = dp_id
+        si.onu_device.uni_ports.first.return_value = uni_port
+        return si
+
+    @requests_mock.Mocker()
+    def test_sync_batch(self, m):
+        """
+        The subscribers of an OLT are added to ONOS together, by the first of them being synchronized
+        """
+        si1 = self.mock_subscriber(1, 1, "of:olt1", 16)
+        si2 = self.mock_subscriber(2, 2, "of:olt2", 16)
+        si3 = self.mock_subscriber(3, 1, "of:olt1", 17)
+
+        pon_ports = [PONPort(id=olt_id, olt_device_id=olt_id) for olt_id in [1, 2]]
+        onus = [ONUDevice(id=si.id, pon_port_id=olt_id) for (si, olt_id) in [(si1, 1), (si2, 2), (si3, 1)]]
+
+        # if the programmed subscribers can't be read, all the subscribers are added
+        programmed = m.get("http://onos_voltha_url:4321/onos/olt/oltapp/programmed-subscribers", status_code=404)
+        m.post("http://onos_voltha_url:4321/onos/olt/oltapp/of:olt1/16", status_code=200)
+        m.post("http://onos_voltha_url:4321/onos/olt/oltapp/of:olt1/17", status_code=200)
+        m.post("http://onos_voltha_url:4321/onos/olt/oltapp/of:olt2/16", status_code=500, text="Mock Error")
+
+        import sync_volt_service_instance
+        from onos_client import OnosClient
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(VOLTService.objects, "get") as olt_service_mock, \
+            patch.object(self.model_accessor, "fetch_pending") as fetch_pending, \
+            patch.object(sync_volt_service_instance.PONPort.objects, "get_items") as pon_port_objects, \
+            patch.object(sync_volt_service_instance.ONUDevice.objects, "get_items") as onu_objects, \
+            patch.object(sync_volt_service_instance, "ThreadPool",
+                         side_effect=sync_volt_service_instance.ThreadPool) as thread_pool, \
+            patch.object(OnosClient, "__init__", autospec=True, side_effect=OnosClient.__init__) as onos_client:
+            olt_service_mock.return_value = self.volt_service
+            fetch_pending.return_value = [si1, si2, si3]
+            pon_port_objects.return_value = pon_ports
+            onu_objects.return_value = onus
+
+            # ONOS is not called while fetching the pending subscribers
+            self.assertEqual(step.fetch_pending(), [si1, si2, si3])
+            self.assertFalse(m.called)
+
+            # the subscribers of the first OLT are added together
+            step.sync_record(si1)
+            self.assertEqual(m.call_count, 3)
+            thread_pool.assert_called_once_with(2)
+            self.assertEqual(si1.backend_handle, "of:olt1/16")
+            self.assertEqual(si3.backend_handle, "of:olt1/17")
+            si1.save.assert_called_with(update_fields=["backend_handle"])
+            si3.save.assert_called_with(update_fields=["backend_handle"])
+
+            step.sync_record(si3)
+            self.assertEqual(m.call_count, 3)
+
+            with self.assertRaises(Exception) as e:
+                step.sync_record(si2)
+            self.assertEqual(e.exception.message, "Failed to add subscriber in onos-voltha: Mock Error")
+            si2.save.assert_not_called()
+
+            # the programmed subscribers are read once per cycle
+            self.assertEqual(m.call_count, 4)
+            self.assertEqual(programmed.call_count, 1)
+            self.assertEqual(onos_client.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_sync_programmed(self, m):
+        """
+        The subscribers already programmed in ONOS, ie: restored by ONOS after a restart, are not added again
+        """
+        si1 = self.mock_subscriber(1, 1, "of:00000000c0a8010b", 16)
+        si2 = self.mock_subscriber(2, 1, "of:00000000c0a8010b", 48)
+        si1.backend_handle = "of:00000000c0a8010b/16"
+
+        pon_ports = [PONPort(id=1, olt_device_id=1)]
+        onus = [ONUDevice(id=si.id, pon_port_id=1) for si in [si1, si2]]
+
+        programmed = m.get("http://onos_voltha_url:4321/onos/olt/oltapp/programmed-subscribers", status_code=200,
+                           json={"entries": [{"location": "of:00000000c0a8010b/16",
+                                              "tagInfo": {"ponCTag": 111, "ponSTag": 7, "serviceName": "hsia"}},
+                                             {"location": "of:00000000c0a8010b/32",
+                                              "tagInfo": {"ponCTag": 112, "ponSTag": 7, "serviceName": "hsia"}}]})
+        added = m.post(requests_mock.ANY, status_code=200)
+
+        import sync_volt_service_instance
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(VOLTService.objects, "get") as olt_service_mock, \
+            patch.object(self.model_accessor, "fetch_pending") as fetch_pending, \
+            patch.object(sync_volt_service_instance.PONPort.objects, "get_items") as pon_port_objects, \
+            patch.object(sync_volt_service_instance.ONUDevice.objects, "get_items") as onu_objects:
+            olt_service_mock.return_value = self.volt_service
+            fetch_pending.side_effect = lambda *args: [si1, si2]
+            pon_port_objects.return_value = pon_ports
+            onu_objects.return_value = onus
+
+            step.fetch_pending()
+            step.sync_record(si1)
+            step.sync_record(si2)
+
+            self.assertEqual(programmed.call_count, 1)
+            self.assertEqual([r.url for r in added.request_history],
+                             ["http://onos_voltha_url:4321/onos/olt/oltapp/of:00000000c0a8010b/48"])
+            si1.save.assert_not_called()
+            self.assertEqual(si2.backend_handle, "of:00000000c0a8010b/48")
+
+            # the programmed subscribers are read again in the next cycle
+            step.fetch_pending()
+            step.sync_record(si1)
+            self.assertEqual(programmed.call_count, 2)
+
+    def test_replay_rate(self):
+        """
+        The subscribers replayed after an ONOS restart are synchronized at a limited rate, one OLT after the other
+        """
+        def replaying(id, olt_id):
+            si = self.mock_subscriber(id, olt_id, "of:olt%s" % olt_id, id)
+            si.onu_device_id = id
+            si.backend_code = 0
+            si.backend_status = "resynchronize due to kubernetes event"
+            return si
+
+        si1 = replaying(1, 2)
+        si2 = replaying(2, 1)
+        si3 = replaying(3, 2)
+        si4 = replaying(4, 1)
+        new = self.mock_subscriber(5, 1, "of:olt1", 5)
+        new.backend_code = 0
+        new.backend_status = None
+
+        pending = [si1, si2, si3, si4, new]
+
+        # the OLTs of the ONUs are loaded in bulk
+        pon_ports = [PONPort(id=olt_id, olt_device_id=olt_id) for olt_id in [1, 2]]
+        onus = [ONUDevice(id=si.id, pon_port_id=olt_id) for (si, olt_id) in [(si1, 2), (si2, 1), (si3, 2), (si4, 1)]]
+
+        import sync_volt_service_instance
+
+        step = self.sync_step(model_accessor=self.model_accessor)
+
+        with patch.object(self.model_accessor, "fetch_pending") as fetch_pending, \
+            patch.object(sync_volt_service_instance.PONPort.objects, "get_items") as pon_port_objects, \
+            patch.object(sync_volt_service_instance.ONUDevice.objects, "get_items") as onu_objects, \
+            patch.object(self.replay, "rate", 1), \
+            patch.object(self.replay, "burst", 2), \
+            patch("subscriber_replay.time.time") as now:
+            fetch_pending.side_effect = lambda *args: list(pending)
+            pon_port_objects.return_value = pon_ports
+            onu_objects.return_value = onus
+
+            now.return_value = 1000.0
+            self.assertEqual(step.fetch_pending(), [si2, si4, new])
+            self.assertEqual(onu_objects.call_count, 1)
+            self.assertEqual(self.replay.progress(),
+                             {"replaying": True, "replayed": 2, "remaining": 2, "started_at": 1000.0})
+
+            # half a second later, no subscriber can be replayed
+            pending = [si1, si3]
+            now.return_value = 1000.5
+            self.assertEqual(step.fetch_pending(), [])
+
+            now.return_value = 1001.0
+            self.assertEqual(step.fetch_pending(), [si1])
+
+            pending = [si3]
+            now.return_value = 1010.0
+            self.assertEqual(step.fetch_pending(), [si3])
+
+            # the replay is over
+            pending = []
+            self.assertEqual(step.fetch_pending(), [])
+            self.assertEqual(self.replay._started_at, None)
+            self.assertFalse(self.replay.progress()["replaying"])
+
+            # the ONUs are not loaded when no subscriber is pending
+            self.assertEqual(onu_objects.call_count, 4)
+
     @requests_mock.Mocker()
     def test_delete(self, m):
         m.delete("http://onos_voltha_url:4321/onos/olt/oltapp/of:dp_id/uni_port_id", status_code=204)
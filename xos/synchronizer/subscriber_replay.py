@@ -0,0 +1,134 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from multistructlog import create_logger
+from xosconfig import Config
+
+log = create_logger(Config().get('logging'))
+
+
+class SubscriberReplay(object):
+    """
+    Replays the subscribers to ONOS at a limited rate, ie: after ONOS restarted.
+
+    The subscribers to replay are marked as such in XOS (backend_code 0 and backend_status REPLAY_STATUS), so that a
+    replay survives a restart of the synchronizer. The sync step then admits the marked subscribers at most rate per
+    second (up to burst seconds worth of them in a sync cycle), one OLT after the other.
+    """
+
+    REPLAY_STATUS = "resynchronize due to kubernetes event"
+
+    # subscribers per second replayed to ONOS
+    rate = 20
+
+    # seconds worth of subscribers that can be admitted at once
+    burst = 5
+
+    _lock = threading.Lock()
+    _tokens = None
+    _last_admit = None
+    _started_at = None
+    _replayed = 0
+    _remaining = 0
+
+    @classmethod
+    def is_replaying(cls, service_instance):
+        return service_instance.backend_code == 0 and service_instance.backend_status == cls.REPLAY_STATUS
+
+    @classmethod
+    def mark(cls, service_instance):
+        """
+        Mark service_instance to be replayed.
+        :return: False if it was already marked
+        """
+        if cls.is_replaying(service_instance):
+            return False
+
+        service_instance.backend_code = 0
+        service_instance.backend_status = cls.REPLAY_STATUS
+        service_instance.save(update_fields=["updated", "backend_code", "backend_status"],
+                              always_update_timestamp=True)
+        return True
+
+    @classmethod
+    def start(cls, marked):
+        with cls._lock:
+            if cls._started_at is None:
+                cls._started_at = time.time()
+                cls._replayed = 0
+
+        log.info("Replaying subscribers to onos-voltha", marked=marked, rate=cls.rate)
+
+    @classmethod
+    def admit(cls, models, key=None):
+        """
+        Return the models to synchronize in this cycle: all the ones that are not being replayed, and as many of the
+        ones being replayed as the rate allows, in key order.
+        :param key: function - sort key of the models being replayed, ie: to replay them one OLT after the other
+        """
+        replaying = sorted([m for m in models if cls.is_replaying(m)], key=key)
+
+        now = time.time()
+        with cls._lock:
+            if not replaying:
+                if cls._started_at is not None:
+                    log.info("Subscriber replay completed", replayed=cls._replayed,
+                             duration=round(now - cls._started_at, 1))
+                cls._tokens = cls._last_admit = cls._started_at = None
+                cls._remaining = 0
+                return models
+
+            if cls._tokens is None:
+                cls._tokens = cls.rate * cls.burst
+            else:
+                cls._tokens = min(cls._tokens + (now - cls._last_admit) * cls.rate, cls.rate * cls.burst)
+            cls._last_admit = now
+
+            admitted = replaying[:int(cls._tokens)]
+            cls._tokens -= len(admitted)
+
+            if cls._started_at is None:
+                cls._started_at = now
+                cls._replayed = 0
+            cls._replayed += len(admitted)
+            replayed = cls._replayed
+
+            remaining = cls._remaining = len(replaying) - len(admitted)
+
+        log.info("Replaying subscribers to onos-voltha", admitted=len(admitted), replayed=replayed,
+                 remaining=remaining, rate=cls.rate, eta=int(remaining / float(cls.rate)))
+
+        admitted = set(id(m) for m in admitted)
+        return [m for m in models if not cls.is_replaying(m) or id(m) in admitted]
+
+    @classmethod
+    def progress(cls):
+        """
+        :return: dict - the progress of the current replay: whether there is one, the subscribers replayed and still
+                 to replay, and when it started
+        """
+        with cls._lock:
+            return {"replaying": cls._started_at is not None,
+                    "replayed": cls._replayed,
+                    "remaining": cls._remaining,
+                    "started_at": cls._started_at}
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._tokens = cls._last_admit = cls._started_at = None
+            cls._replayed = cls._remaining = 0
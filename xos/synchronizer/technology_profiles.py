@@ -0,0 +1,70 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from xossynchronizer.modelaccessor import TechnologyProfile
+
+
+class TechnologyProfileIndex(object):
+    """
+    The technologies that have at least one TechnologyProfile synchronized (pushed to ETCD).
+
+    An OLT can't be provisioned until a profile for its technology is ready, and every OLT checks that on every sync.
+    The index is loaded from XOS with a single query, kept for ttl seconds, and updated by SyncTechnologyProfile as
+    soon as a profile is synchronized, so that the OLTs waiting for it are picked up in the next sync cycle.
+    """
+
+    # the index is reloaded from XOS after this many seconds
+    ttl = 60
+
+    _lock = threading.Lock()
+    _technologies = None
+    _loaded_at = 0
+
+    @classmethod
+    def load(cls):
+        technologies = set(tp.technology for tp in TechnologyProfile.objects.filter(backend_code=1))
+
+        with cls._lock:
+            cls._technologies = technologies
+            cls._loaded_at = time.time()
+
+        return technologies
+
+    @classmethod
+    def is_ready(cls, technology):
+        with cls._lock:
+            technologies = cls._technologies
+            if technologies is not None and time.time() - cls._loaded_at > cls.ttl:
+                technologies = None
+
+        if technologies is None:
+            technologies = cls.load()
+
+        return technology in technologies
+
+    @classmethod
+    def mark_ready(cls, technology):
+        with cls._lock:
+            # if the index is not loaded yet, the profile will be found in XOS when it is
+            if cls._technologies is not None:
+                cls._technologies = cls._technologies | {technology}
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._technologies = None
+            cls._loaded_at = 0
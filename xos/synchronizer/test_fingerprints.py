@@ -0,0 +1,60 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import Mock
+
+from fingerprints import FingerprintCache
+
+
+class TestFingerprintCache(unittest.TestCase):
+
+    def setUp(self):
+        FingerprintCache.clear()
+
+        self.model = Mock()
+        self.model.id = 1
+
+    def tearDown(self):
+        FingerprintCache.clear()
+
+    def test_fingerprint(self):
+        self.assertEqual(FingerprintCache.fingerprint("ACTIVE", {"a": 1, "b": 2}),
+                         FingerprintCache.fingerprint("ACTIVE", {"b": 2, "a": 1}))
+        self.assertNotEqual(FingerprintCache.fingerprint("ACTIVE", 1), FingerprintCache.fingerprint("ACTIVE", 2))
+
+    def test_unchanged(self):
+        fingerprint = FingerprintCache.fingerprint("ACTIVE")
+
+        self.assertFalse(FingerprintCache.unchanged("OLTDevice", self.model, fingerprint))
+
+        FingerprintCache.update("OLTDevice", self.model, fingerprint)
+        self.assertTrue(FingerprintCache.unchanged("OLTDevice", self.model, fingerprint))
+        self.assertFalse(FingerprintCache.unchanged("OLTDevice", self.model, FingerprintCache.fingerprint("UNKNOWN")))
+        self.assertFalse(FingerprintCache.unchanged("ONUDevice", self.model, fingerprint))
+
+        FingerprintCache.forget("OLTDevice", self.model)
+        self.assertFalse(FingerprintCache.unchanged("OLTDevice", self.model, fingerprint))
+
+    def test_unsaved_model(self):
+        self.model.id = None
+        fingerprint = FingerprintCache.fingerprint("ACTIVE")
+
+        FingerprintCache.update("OLTDevice", self.model, fingerprint)
+        self.assertFalse(FingerprintCache.unchanged("OLTDevice", self.model, fingerprint))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,7 +14,7 @@
 
 import unittest
 
-from mock import Mock
+from mock import Mock, patch
 
 from helpers import Helpers
 
@@ -22,6 +22,7 @@ from helpers import Helpers
 class TestHelpers(unittest.TestCase):
 
     def setUp(self):
+        Helpers.clear_cache()
 
         # create a mock ONOS Service
         onos = Mock()
@@ -40,8 +41,14 @@ class TestHelpers(unittest.TestCase):
         o.voltha_pass = "voltha_pass"
 
         o.provider_services = [onos]
+        o.id = 1
+        o.updated = 1000.0
 
         self.o = o
+        self.onos = onos
+
+    def tearDown(self):
+        Helpers.clear_cache()
 
     def test_format_url(self):
         url = Helpers.format_url("onf.com")
@@ -69,6 +76,31 @@ class TestHelpers(unittest.TestCase):
         self.assertEqual(onos_voltha_dict["user"], "onos_voltha_user")
         self.assertEqual(onos_voltha_dict["pass"], "onos_voltha_pass")
 
+    def test_cache(self):
+        self.assertEqual(Helpers.get_voltha_info(self.o)["url"], "http://voltha_url")
+        self.assertEqual(Helpers.get_onos_voltha_info(self.o)["url"], "http://onos_voltha_url")
+
+        # nothing is read again until the service changes
+        self.o.voltha_url = "new_voltha_url"
+        self.o.provider_services = []
+        self.assertEqual(Helpers.get_voltha_info(self.o)["url"], "http://voltha_url")
+        self.assertEqual(Helpers.get_onos_voltha_info(self.o)["url"], "http://onos_voltha_url")
+
+        self.o.updated = 1001.0
+        self.assertEqual(Helpers.get_voltha_info(self.o)["url"], "http://new_voltha_url")
+        with self.assertRaises(Exception) as e:
+            Helpers.get_onos(self.o)
+        self.assertEqual(e.exception.message, "Cannot find ONOS service in provider_services of vOLTService")
+
+    def test_cache_ttl(self):
+        Helpers.get_onos_voltha_info(self.o)
+
+        self.onos.leaf_model.rest_hostname = "new_onos_voltha_url"
+        self.assertEqual(Helpers.get_onos_voltha_info(self.o)["url"], "http://onos_voltha_url")
+
+        with patch.object(Helpers, "cache_ttl", -1):
+            self.assertEqual(Helpers.get_onos_voltha_info(self.o)["url"], "http://new_onos_voltha_url")
+
     def test_datapath_id_to_hex(self):
         hex = Helpers.datapath_id_to_hex(55334486016)
         self.assertEqual(hex, "0000000ce2314000")
@@ -0,0 +1,139 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from mock import patch
+
+import os, sys
+
+test_path=os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+class TestOLTSubscriberIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.sys_path_save = sys.path
+
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "test_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from xossynchronizer.mock_modelaccessor_build import mock_modelaccessor_config
+        mock_modelaccessor_config(test_path, [("olt-service", "volt.xproto"),
+                                              ("rcord", "rcord.xproto")])
+
+        import xossynchronizer.modelaccessor
+        import mock_modelaccessor
+        reload(mock_modelaccessor)  # in case nose2 loaded it in a previous test
+        reload(xossynchronizer.modelaccessor)  # in case nose2 loaded it in a previous test
+
+        import olt_subscribers
+        reload(olt_subscribers)  # so that it uses the models loaded above
+        from olt_subscribers import OLTSubscriberIndex
+        self.index = OLTSubscriberIndex
+        self.index.clear()
+
+        from xossynchronizer.modelaccessor import model_accessor
+
+        # import all class names to globals
+        for (k, v) in model_accessor.all_model_classes.items():
+            globals()[k] = v
+
+        self.pon_ports = [PONPort(id=11, olt_device_id=1), PONPort(id=21, olt_device_id=2)]
+        self.onus = [ONUDevice(id=111, pon_port_id=11), ONUDevice(id=112, pon_port_id=11)]
+        self.volt_sis = [VOLTServiceInstance(id=1111, onu_device_id=111),
+                         VOLTServiceInstance(id=1121, onu_device_id=112)]
+        self.subscribers = [RCORDSubscriber(id=11111, name="sub1"), RCORDSubscriber(id=11211, name="sub2")]
+        self.links = [ServiceInstanceLink(provider_service_instance_id=1111, subscriber_service_instance_id=11111),
+                      ServiceInstanceLink(provider_service_instance_id=1121, subscriber_service_instance_id=11211)]
+
+        self.patchers = [patch.object(m.objects, "get_items", return_value=items) for (m, items) in [
+            (PONPort, self.pon_ports),
+            (ONUDevice, self.onus),
+            (VOLTServiceInstance, self.volt_sis),
+            (ServiceInstance, self.volt_sis + self.subscribers),
+            (ServiceInstanceLink, self.links)]]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.index.clear()
+        sys.path = self.sys_path_save
+
+    def test_load(self):
+        self.assertEqual(self.index.subscribers(1), ["sub1", "sub2"])
+        self.assertEqual(self.index.subscribers(2), [])
+        self.assertEqual(self.index.subscribers(3), [])
+
+    def test_not_loaded(self):
+        self.assertFalse(self.index.is_loaded())
+
+        # nothing is recorded until the index is loaded from XOS
+        self.index.update(1131, 113, 1, ["sub3"])
+        self.index.set_onu(111, 2)
+        self.index.remove(1121)
+
+        self.assertEqual(self.index.subscribers(1), ["sub1", "sub2"])
+        self.assertTrue(self.index.is_loaded())
+
+    def test_update(self):
+        self.index.subscribers(1)
+
+        with patch.object(ONUDevice.objects, "get_items") as onu_objects:
+            self.index.update(1131, 113, 2, ["sub3"])
+            self.index.update(1121, 112, 1, ["sub2", "sub2b"])
+
+            self.assertEqual(self.index.subscribers(1), ["sub1", "sub2", "sub2b"])
+            self.assertEqual(self.index.subscribers(2), ["sub3"])
+
+            # a subscriber moving to another ONU
+            self.index.update(1111, 113, 2, ["sub1"])
+            self.assertEqual(self.index.subscribers(1), ["sub2", "sub2b"])
+            self.assertEqual(self.index.subscribers(2), ["sub1", "sub3"])
+
+            # the index is not loaded again
+            onu_objects.assert_not_called()
+
+    def test_set_onu(self):
+        self.index.subscribers(1)
+
+        # the ONU of sub1 moved to the other OLT
+        self.index.set_onu(111, 2)
+
+        self.assertEqual(self.index.subscribers(1), ["sub2"])
+        self.assertEqual(self.index.subscribers(2), ["sub1"])
+
+    def test_remove(self):
+        self.index.subscribers(1)
+
+        self.index.remove(1111)
+        self.index.remove(1234)
+
+        self.assertEqual(self.index.subscribers(1), ["sub2"])
+
+    def test_ttl(self):
+        self.index.subscribers(1)
+
+        self.volt_sis.pop()
+        self.assertEqual(self.index.subscribers(1), ["sub1", "sub2"])
+
+        self.index._loaded_at = 0
+        self.assertEqual(self.index.subscribers(1), ["sub1"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from mock import Mock
+
+import os
+
+test_path=os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+class TestOnosClient(unittest.TestCase):
+
+    def setUp(self):
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "test_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from onos_client import OnosClient
+        self.client = OnosClient
+        self.client.clear()
+
+        onos = Mock()
+        onos.name = "ONOS"
+        onos.leaf_model.rest_hostname = "onos"
+        onos.leaf_model.rest_port = 8181
+        onos.leaf_model.rest_username = "karaf"
+        onos.leaf_model.rest_password = "karaf"
+
+        self.volt_service = Mock()
+        self.volt_service.id = None
+        self.volt_service.provider_services = [onos]
+
+    def tearDown(self):
+        self.client.clear()
+
+    def test_shared_per_endpoint(self):
+        client = self.client.for_service(self.volt_service)
+        self.assertEqual(client.base_url, "http://onos:8181/onos")
+        self.assertIs(self.client.for_service(self.volt_service), client)
+
+    def test_parse_programmed_subscribers(self):
+        # as returned by GET /onos/olt/oltapp/programmed-subscribers
+        payload = json.loads("""
+        {
+          "entries": [
+            {
+              "location": "of:00000000c0a8010b/16",
+              "tagInfo": {
+                "uniTagMatch": 0,
+                "ponCTag": 111,
+                "ponSTag": 7,
+                "usPonCTagPriority": -1,
+                "usPonSTagPriority": -1,
+                "dsPonCTagPriority": -1,
+                "dsPonSTagPriority": -1,
+                "technologyProfileId": 64,
+                "upstreamBandwidthProfile": "Default",
+                "downstreamBandwidthProfile": "Default",
+                "serviceName": "hsia",
+                "enableMacLearning": false,
+                "configuredMacAddress": "A4:23:05:00:00:00",
+                "isDhcpRequired": true,
+                "isIgmpRequired": false
+              }
+            },
+            {
+              "location": "of:00000000c0a8010b/32",
+              "tagInfo": {
+                "ponCTag": 112,
+                "ponSTag": 7,
+                "technologyProfileId": 64,
+                "serviceName": "hsia"
+              }
+            }
+          ]
+        }
+        """)
+
+        self.assertEqual(self.client.parse_programmed_subscribers(payload),
+                         set(["of:00000000c0a8010b/16", "of:00000000c0a8010b/32"]))
+        self.assertEqual(self.client.parse_programmed_subscribers({"entries": []}), set())
+
+    def test_parse_programmed_subscribers_unexpected(self):
+        for data in [[], {}, ["of:00000000c0a8010b/16"], {"entries": [{"connectPoint": "of:00000000c0a8010b/16"}]},
+                     {"entries": [{"location": 16}]}]:
+            with self.assertRaises(ValueError):
+                self.client.parse_programmed_subscribers(data)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import requests_mock
+
+import os
+
+test_path=os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+class TestOnosNetworkConfig(unittest.TestCase):
+
+    def setUp(self):
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "test_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from onos_netcfg import OnosNetworkConfig
+        self.netcfg = OnosNetworkConfig
+        self.netcfg.clear()
+
+        from onos_client import OnosClient
+        self.onos = OnosClient("http://onos", 8181, "karaf", "karaf")
+
+        self.devices = {
+            "of:0000000000000001": {"basic": {"name": "olt1"}},
+            "of:0000000000000002": {"basic": {"name": "olt2"}},
+        }
+
+    def tearDown(self):
+        self.netcfg.clear()
+
+    def test_includes(self):
+        self.assertTrue(self.netcfg.includes({"basic": {"name": "olt1", "driver": "voltha"}},
+                                             {"basic": {"name": "olt1"}}))
+        self.assertFalse(self.netcfg.includes({"basic": {"name": "olt2"}}, {"basic": {"name": "olt1"}}))
+        self.assertFalse(self.netcfg.includes({"ports": {}}, {"basic": {"name": "olt1"}}))
+        self.assertFalse(self.netcfg.includes(None, {"basic": {"name": "olt1"}}))
+
+    @requests_mock.Mocker()
+    def test_changes(self, m):
+        # nothing is known about ONOS, everything has to be pushed
+        self.assertEqual(self.netcfg.changes(self.onos, self.devices), self.devices)
+
+        m.get("http://onos:8181/onos/v1/network/configuration/devices", status_code=200,
+              json={"of:0000000000000001": {"basic": {"name": "olt1", "driver": "voltha"}}})
+        self.netcfg.refresh(self.onos)
+
+        self.assertEqual(self.netcfg.changes(self.onos, self.devices),
+                         {"of:0000000000000002": {"basic": {"name": "olt2"}}})
+
+    @requests_mock.Mocker()
+    def test_refresh_failure(self, m):
+        m.get("http://onos:8181/onos/v1/network/configuration/devices", status_code=200, json={})
+        self.netcfg.refresh(self.onos)
+        self.assertEqual(self.netcfg.changes(self.onos, self.devices), self.devices)
+
+        # when the configuration can't be read, it's considered unknown
+        m.get("http://onos:8181/onos/v1/network/configuration/devices", status_code=500, text="error")
+        self.assertEqual(self.netcfg.refresh(self.onos), None)
+        self.assertEqual(self.netcfg.changes(self.onos, self.devices), self.devices)
+
+    @requests_mock.Mocker()
+    def test_push(self, m):
+        m.get("http://onos:8181/onos/v1/network/configuration/devices", status_code=200, json={})
+        m.post("http://onos:8181/onos/v1/network/configuration/", status_code=500)
+        self.netcfg.refresh(self.onos)
+
+        # rejected configurations are not recorded
+        self.assertEqual(self.netcfg.push(self.onos, self.devices).status_code, 500)
+        self.assertEqual(self.netcfg.changes(self.onos, self.devices), self.devices)
+
+        m.post("http://onos:8181/onos/v1/network/configuration/", status_code=200)
+        self.assertEqual(self.netcfg.push(self.onos, self.devices).status_code, 200)
+        self.assertEqual(m.last_request.json(), {"devices": self.devices})
+        self.assertEqual(self.netcfg.changes(self.onos, self.devices), {})
+
+if __name__ == "__main__":
+    unittest.main()
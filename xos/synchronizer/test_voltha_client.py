@@ -0,0 +1,72 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import Mock, patch
+import requests_mock
+
+from voltha_client import VolthaClient
+
+
+class TestVolthaClient(unittest.TestCase):
+
+    def setUp(self):
+        VolthaClient.clear()
+
+        self.volt_service = Mock()
+        self.volt_service.voltha_url = "voltha_url"
+        self.volt_service.voltha_port = 1234
+
+    def tearDown(self):
+        VolthaClient.clear()
+
+    def test_shared_per_endpoint(self):
+        client = VolthaClient.for_service(self.volt_service)
+        self.assertEqual(client.base_url, "http://voltha_url:1234/api/v1")
+        self.assertIs(VolthaClient.for_service(self.volt_service), client)
+
+        other_service = Mock()
+        other_service.voltha_url = "http://other_voltha"
+        other_service.voltha_port = 1234
+        self.assertIsNot(VolthaClient.for_service(other_service), client)
+
+    @requests_mock.Mocker()
+    def test_requests(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices/olt/ports", status_code=200, json={"items": []})
+        m.post("http://voltha_url:1234/api/v1/devices", status_code=200, json={"id": "olt"})
+        m.post("http://voltha_url:1234/api/v1/devices/olt/enable", status_code=200)
+        m.delete("http://voltha_url:1234/api/v1/devices/olt/delete", status_code=200)
+
+        client = VolthaClient.for_service(self.volt_service)
+
+        self.assertEqual(client.device_ports("olt").json(), {"items": []})
+        self.assertEqual(client.create_device({"type": "openolt"}).json(), {"id": "olt"})
+        self.assertEqual(m.last_request.json(), {"type": "openolt"})
+        self.assertEqual(client.enable("olt").status_code, 200)
+        self.assertEqual(client.delete("olt").status_code, 200)
+
+    def test_timeout(self):
+        client = VolthaClient.for_service(self.volt_service)
+
+        with patch.object(client.session, "get") as mock_get:
+            client.list_devices()
+            mock_get.assert_called_with("http://voltha_url:1234/api/v1/devices", timeout=VolthaClient.timeout)
+
+            client.list_devices(timeout=1)
+            mock_get.assert_called_with("http://voltha_url:1234/api/v1/devices", timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
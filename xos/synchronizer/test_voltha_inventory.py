@@ -0,0 +1,263 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from mock import patch, Mock
+import requests_mock
+
+import os
+
+test_path=os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
+
+class TestDeviceSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "test_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from voltha_inventory import DeviceSnapshot
+        self.snapshot = DeviceSnapshot
+        self.snapshot.clear()
+
+        self.volt_service = Mock()
+        self.volt_service.voltha_url = "voltha_url"
+        self.volt_service.voltha_port = 1234
+
+        self.devices = {
+            "items": [
+                {"id": "olt_id", "type": "openolt"},
+                {"id": "onu_id", "type": "brcm_openomci_onu"},
+            ]
+        }
+
+    def tearDown(self):
+        self.snapshot.clear()
+
+    @requests_mock.Mocker()
+    def test_partition(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+
+        snapshot = self.snapshot.get(self.volt_service, "olt")
+
+        self.assertEqual([d["id"] for d in snapshot.olts], ["olt_id"])
+        self.assertEqual([d["id"] for d in snapshot.onus], ["onu_id"])
+
+    @requests_mock.Mocker()
+    def test_shared_between_consumers(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+
+        olt_snapshot = self.snapshot.get(self.volt_service, "olt")
+        onu_snapshot = self.snapshot.get(self.volt_service, "onu")
+
+        self.assertIs(olt_snapshot, onu_snapshot)
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_refetch_for_same_consumer(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+
+        first = self.snapshot.get(self.volt_service, "olt")
+        second = self.snapshot.get(self.volt_service, "olt")
+
+        self.assertIsNot(first, second)
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_one_fetch_per_cycle(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices", status_code=200, json=self.devices)
+
+        # a snapshot is shared until a step asks again, ie: in the next cycle, however long the cycle takes
+        cycles = [(self.snapshot.get(self.volt_service, "olt"), self.snapshot.get(self.volt_service, "onu"))
+                  for _ in range(3)]
+
+        for (olt_snapshot, onu_snapshot) in cycles:
+            self.assertIs(olt_snapshot, onu_snapshot)
+        self.assertEqual(len(set(id(olt_snapshot) for (olt_snapshot, _) in cycles)), 3)
+        self.assertEqual(m.call_count, 3)
+
+    @requests_mock.Mocker()
+    def test_failure_not_cached(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices", [
+            {"status_code": 500, "text": "MockError"},
+            {"status_code": 200, "json": self.devices}
+        ])
+
+        self.assertIsNone(self.snapshot.get(self.volt_service, "olt"))
+        self.assertIsNotNone(self.snapshot.get(self.volt_service, "onu"))
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_blank_response(self, m):
+        m.get("http://voltha_url:1234/api/v1/devices", status_code=200, text="")
+
+        self.assertIsNone(self.snapshot.get(self.volt_service, "olt"))
+
+class TestLogicalDeviceIndex(unittest.TestCase):
+
+    def setUp(self):
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "test_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from voltha_inventory import LogicalDeviceIndex
+        self.index = LogicalDeviceIndex
+        self.index.clear()
+
+        self.volt_service = Mock()
+        self.volt_service.voltha_url = "voltha_url"
+        self.volt_service.voltha_port = 1234
+
+        self.logical_devices = {
+            "items": [
+                {"root_device_id": "olt1", "id": "0001000ce2314000", "datapath_id": "55334486016"},
+                {"root_device_id": "olt2", "id": "0001000ce2314001", "datapath_id": "55334486017"},
+            ]
+        }
+
+    def tearDown(self):
+        self.index.clear()
+
+    @requests_mock.Mocker()
+    def test_lookup(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+
+        self.assertEqual(self.index.lookup(self.volt_service, "olt1"),
+                         {"of_id": "0001000ce2314000", "dp_id": "of:0000000ce2314000"})
+        self.assertEqual(self.index.lookup(self.volt_service, "olt2"),
+                         {"of_id": "0001000ce2314001", "dp_id": "of:0000000ce2314001"})
+
+        # the list is downloaded only once
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_lookup_expired(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+
+        self.index.lookup(self.volt_service, "olt1")
+        with patch.object(self.index, "max_age", -1):
+            self.index.lookup(self.volt_service, "olt1")
+
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_lookup_miss_refreshes_device(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+        m.get("http://voltha_url:1234/api/v1/devices/olt3", status_code=200, json={"id": "olt3", "parent_id": "ld3"})
+        m.get("http://voltha_url:1234/api/v1/logical_devices/ld3", status_code=200,
+              json={"root_device_id": "olt3", "id": "ld3", "datapath_id": "55334486018"})
+
+        self.assertEqual(self.index.lookup(self.volt_service, "olt3"),
+                         {"of_id": "ld3", "dp_id": "of:0000000ce2314002"})
+        self.assertEqual(m.call_count, 3)
+
+        # the refreshed device is now part of the index
+        self.assertEqual(self.index.lookup(self.volt_service, "olt3")["of_id"], "ld3")
+        self.assertEqual(m.call_count, 3)
+
+    @requests_mock.Mocker()
+    def test_lookup_miss_no_logical_device(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+        m.get("http://voltha_url:1234/api/v1/devices/olt3", status_code=200, json={"id": "olt3", "parent_id": ""})
+
+        self.assertIsNone(self.index.lookup(self.volt_service, "olt3"))
+        self.assertEqual(m.call_count, 2)
+
+        # the miss is remembered until the index is rebuilt
+        self.assertIsNone(self.index.lookup(self.volt_service, "olt3"))
+        self.assertEqual(m.call_count, 2)
+
+        self.index.refresh(self.volt_service)
+        self.assertIsNone(self.index.lookup(self.volt_service, "olt3"))
+        self.assertEqual(m.call_count, 4)
+
+    @requests_mock.Mocker()
+    def test_cached(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=200, json=self.logical_devices)
+
+        self.assertIsNone(self.index.cached(self.volt_service, "olt1"))
+
+        self.index.refresh(self.volt_service)
+        self.assertEqual(self.index.cached(self.volt_service, "olt1")["of_id"], "0001000ce2314000")
+        self.assertIsNone(self.index.cached(self.volt_service, "olt3"))
+
+        # nothing is fetched for a device that is not indexed
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_refresh_fail(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices", status_code=500, text="MockError")
+
+        with self.assertRaises(Exception) as e:
+            self.index.lookup(self.volt_service, "olt1")
+
+        self.assertEqual(e.exception.message, "Failed to retrieve logical devices from VOLTHA: MockError")
+
+class TestLogicalPortCache(unittest.TestCase):
+
+    def setUp(self):
+        # Setting up the config module
+        from xosconfig import Config
+        config = os.path.join(test_path, "test_config.yaml")
+        Config.clear()
+        Config.init(config, "synchronizer-config-schema.yaml")
+        # END Setting up the config module
+
+        from voltha_inventory import LogicalPortCache
+
+        self.volt_service = Mock()
+        self.volt_service.voltha_url = "voltha_url"
+        self.volt_service.voltha_port = 1234
+
+        self.cache = LogicalPortCache(self.volt_service)
+
+        self.logical_ports = {
+            "items": [
+                {"device_id": "onu1", "ofp_port": {"port_no": 16}},
+                {"device_id": "onu2", "ofp_port": {"port_no": 32}},
+                {"device_id": "olt1", "ofp_port": {"port_no": 65536}},
+            ]
+        }
+
+    @requests_mock.Mocker()
+    def test_get_port_numbers(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices/of_id/ports", status_code=200, json=self.logical_ports)
+
+        self.assertEqual(self.cache.get_port_numbers("of_id", "onu1"), [16])
+        self.assertEqual(self.cache.get_port_numbers("of_id", "onu2"), [32])
+        self.assertEqual(self.cache.get_port_numbers("of_id", "onu3"), [])
+
+        # the ports are downloaded only once per logical device
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_get_port_numbers_fail(self, m):
+        m.get("http://voltha_url:1234/api/v1/logical_devices/of_id/ports", [
+            {"status_code": 500, "text": "MockError"},
+            {"status_code": 200, "json": self.logical_ports}
+        ])
+
+        self.assertEqual(self.cache.get_port_numbers("of_id", "onu1"), [])
+        # a failure is not cached
+        self.assertEqual(self.cache.get_port_numbers("of_id", "onu1"), [16])
+        self.assertEqual(m.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
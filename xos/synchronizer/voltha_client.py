@@ -0,0 +1,110 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from helpers import Helpers
+
+
+class VolthaClient(object):
+    """
+    A client for the VOLTHA REST API.
+
+    A client is created once per VOLTHA endpoint and shared by all the steps (and threads) talking to it: requests go
+    through a pooled requests.Session, so connections are kept alive and reused instead of being opened on every call.
+
+    Every method returns the requests.Response, it's up to the caller to check the status code. Connection errors are
+    raised as usual.
+    """
+
+    # maximum number of connections kept open towards a VOLTHA
+    pool_size = 32
+
+    # default timeout (in seconds) of a request, every method accepts a timeout to override it
+    timeout = 10
+
+    _lock = threading.Lock()
+    _clients = {}
+
+    def __init__(self, url, port):
+        self.base_url = "%s:%s/api/v1" % (url, port)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def for_service(cls, volt_service):
+        """
+        Return the client for the VOLTHA used by volt_service.
+        :param volt_service: VOLTService
+        :return: VolthaClient
+        """
+        voltha = Helpers.get_voltha_info(volt_service)
+        key = (voltha['url'], voltha['port'])
+
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = cls(voltha['url'], voltha['port'])
+            return cls._clients[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._clients = {}
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return self.timeout
+        return timeout
+
+    def _get(self, path, timeout=None):
+        return self.session.get(self.base_url + path, timeout=self._timeout(timeout))
+
+    def _post(self, path, json=None, timeout=None):
+        return self.session.post(self.base_url + path, json=json, timeout=self._timeout(timeout))
+
+    def list_devices(self, timeout=None):
+        return self._get("/devices", timeout=timeout)
+
+    def get_device(self, device_id, timeout=None):
+        return self._get("/devices/%s" % device_id, timeout=timeout)
+
+    def device_ports(self, device_id, timeout=None):
+        return self._get("/devices/%s/ports" % device_id, timeout=timeout)
+
+    def logical_devices(self, timeout=None):
+        return self._get("/logical_devices", timeout=timeout)
+
+    def logical_device(self, logical_device_id, timeout=None):
+        return self._get("/logical_devices/%s" % logical_device_id, timeout=timeout)
+
+    def logical_device_ports(self, logical_device_id, timeout=None):
+        return self._get("/logical_devices/%s/ports" % logical_device_id, timeout=timeout)
+
+    def create_device(self, data, timeout=None):
+        return self._post("/devices", json=data, timeout=timeout)
+
+    def enable(self, device_id, timeout=None):
+        return self._post("/devices/%s/enable" % device_id, timeout=timeout)
+
+    def disable(self, device_id, timeout=None):
+        return self._post("/devices/%s/disable" % device_id, timeout=timeout)
+
+    def delete(self, device_id, timeout=None):
+        return self.session.delete(self.base_url + "/devices/%s/delete" % device_id, timeout=self._timeout(timeout))
@@ -0,0 +1,262 @@
+# Copyright 2017-present Open Networking Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from multistructlog import create_logger
+from xosconfig import Config
+
+from helpers import Helpers
+from voltha_client import VolthaClient
+
+log = create_logger(Config().get('logging'))
+
+
+class DeviceSnapshot(object):
+    """
+    An immutable view of the VOLTHA device inventory, partitioned into OLTs and ONUs.
+
+    The OLT and ONU pull steps run concurrently on every pull cycle and both need the device list. The first step
+    asking for it fetches and parses it, the other one gets the same snapshot, so VOLTHA is asked for
+    /api/v1/devices only once per cycle. A step asking twice (ie: on the next cycle) always triggers a new fetch, so
+    a snapshot is reused within a pull cycle however long the cycle takes, and never across cycles.
+
+    NOTE the device dictionaries are shared between the pull steps and must not be modified.
+    """
+
+    _lock = threading.Lock()
+    _snapshots = {}
+
+    def __init__(self, devices):
+        self.olts = tuple(d for d in devices if "olt" in d["type"])
+        self.onus = tuple(d for d in devices if "onu" in d["type"])
+
+    @classmethod
+    def get(cls, volt_service, consumer):
+        """
+        Return the device snapshot for the VOLTHA used by volt_service, fetching it if needed.
+        :param volt_service: VOLTService
+        :param consumer: string - the name of the caller, each consumer gets a snapshot only once
+        :return: DeviceSnapshot, or None if VOLTHA did not return a device list
+        """
+        voltha = VolthaClient.for_service(volt_service)
+        key = voltha.base_url
+
+        # NOTE the lock is held while fetching so that concurrent consumers wait for the same snapshot
+        with cls._lock:
+            (snapshot, consumers) = cls._snapshots.get(key, (None, set()))
+
+            if snapshot is None or consumer in consumers:
+                snapshot = cls.fetch(voltha)
+                if snapshot is None:
+                    cls._snapshots.pop(key, None)
+                    return None
+                consumers = set()
+                cls._snapshots[key] = (snapshot, consumers)
+
+            consumers.add(consumer)
+            return snapshot
+
+    @classmethod
+    def fetch(cls, voltha):
+        """
+        Fetch the device list from VOLTHA, through a VolthaClient.
+
+        Returns a DeviceSnapshot, or None in case VOLTHA did not return a device list.
+        Connection errors and invalid JSON are left to the caller.
+        """
+        r = voltha.list_devices(timeout=1)
+
+        if r.status_code != 200:
+            log.warn("[Device snapshot] It was not possible to fetch devices from VOLTHA", status_code=r.status_code)
+            return None
+
+        # [SEBA-367] Handling blank response received from Voltha, Scenario occurs when voltha api is called while
+        # vcore service is re-starting
+        if not r.text:
+            log.debug("[Device snapshot] Blank response received")
+            return None
+
+        return cls(r.json()["items"])
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._snapshots = {}
+
+
+class LogicalDeviceIndex(object):
+    """
+    An index of the VOLTHA logical devices, keyed by root_device_id.
+
+    Each entry carries the logical device id (of_id) and its datapath id converted to hex (dp_id). The OLT pull step
+    rebuilds the index once per cycle and SyncOLTDevice consults it as well, so resolving the logical device of an OLT
+    does not require downloading and scanning the whole logical device list. On a miss only the requested device is
+    refreshed, and a device that has no logical device is not refreshed again until the index is rebuilt.
+    """
+
+    # an index older than this (in seconds) is rebuilt before being used
+    max_age = 30
+
+    _lock = threading.Lock()
+    _indexes = {}
+
+    @staticmethod
+    def entry(ld):
+        dp_id = None
+        if ld.get("datapath_id"):
+            dp_id = "of:" + Helpers.datapath_id_to_hex(ld["datapath_id"])  # convert to hex
+        return {"of_id": ld["id"], "dp_id": dp_id}
+
+    @classmethod
+    def refresh(cls, volt_service):
+        """
+        Rebuild the index from the full logical device list.
+        :param volt_service: VOLTService
+        :return: dict - root_device_id -> {"of_id", "dp_id"}
+        """
+        voltha = VolthaClient.for_service(volt_service)
+
+        r = voltha.logical_devices(timeout=1)
+
+        if r.status_code != 200:
+            raise Exception("Failed to retrieve logical devices from VOLTHA: %s" % r.text)
+
+        index = dict((ld["root_device_id"], cls.entry(ld)) for ld in r.json()["items"])
+
+        with cls._lock:
+            cls._indexes[voltha.base_url] = (time.time(), index)
+
+        return index
+
+    @classmethod
+    def refresh_device(cls, volt_service, device_id):
+        """
+        Refresh the index entry for a single device, through its parent_id (the id of the logical device it is the
+        root of). A device with no logical device is remembered as such until the index is rebuilt, so that it is
+        refreshed at most once per cycle.
+        :return: dict - {"of_id", "dp_id"}, or None if the device has no logical device
+        """
+        voltha = VolthaClient.for_service(volt_service)
+
+        entry = None
+
+        r = voltha.get_device(device_id, timeout=1)
+        if r.status_code == 200 and r.json().get("parent_id"):
+            r = voltha.logical_device(r.json()["parent_id"], timeout=1)
+            if r.status_code == 200 and r.json().get("root_device_id") == device_id:
+                entry = cls.entry(r.json())
+
+        with cls._lock:
+            (built_at, index) = cls._indexes.get(voltha.base_url, (0, {}))
+            index[device_id] = entry
+            cls._indexes[voltha.base_url] = (built_at, index)
+
+        return entry
+
+    @classmethod
+    def lookup(cls, volt_service, device_id):
+        """
+        Return the logical device whose root is device_id.
+        :param volt_service: VOLTService
+        :param device_id: string - VOLTHA id of the OLT
+        :return: dict - {"of_id", "dp_id"}, or None if the device has no logical device
+        """
+        voltha = VolthaClient.for_service(volt_service)
+
+        with cls._lock:
+            (built_at, index) = cls._indexes.get(voltha.base_url, (None, None))
+
+        if index is None or time.time() - built_at > cls.max_age:
+            index = cls.refresh(volt_service)
+
+        if device_id in index:
+            return index[device_id]
+
+        return cls.refresh_device(volt_service, device_id)
+
+    @classmethod
+    def cached(cls, volt_service, device_id):
+        """
+        Return the logical device whose root is device_id as currently indexed, without fetching anything from VOLTHA.
+        :return: dict - {"of_id", "dp_id"}, or None if the device is not indexed or has no logical device
+        """
+        voltha = VolthaClient.for_service(volt_service)
+
+        with cls._lock:
+            (built_at, index) = cls._indexes.get(voltha.base_url, (None, {}))
+            return index.get(device_id)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._indexes = {}
+
+
+class LogicalPortCache(object):
+    """
+    The ports of the VOLTHA logical devices, grouped by the device they belong to.
+
+    A cache is meant to live for a single pull cycle: the ports of a logical device (ie: an OLT) are fetched with a
+    single request the first time they are needed, every following lookup is a dictionary lookup.
+
+    The cache can be shared between threads, concurrent lookups on the same logical device wait for a single fetch.
+    """
+
+    def __init__(self, volt_service):
+        self.volt_service = volt_service
+        self.ports = {}
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+
+    def get_port_numbers(self, logical_device_id, device_id):
+        """
+        Return the openflow port numbers of a device, as represented in the logical device.
+        :param logical_device_id: string - of_id of the OLT
+        :param device_id: string - VOLTHA id of the device owning the ports (ie: an ONU)
+        :return: list of int
+        """
+        if logical_device_id not in self.ports:
+            with self._lock:
+                fetch_lock = self._fetch_locks.setdefault(logical_device_id, threading.Lock())
+
+            with fetch_lock:
+                if logical_device_id not in self.ports:
+                    ports = self.fetch(logical_device_id)
+                    if ports is None:
+                        return []
+                    self.ports[logical_device_id] = ports
+
+        return self.ports[logical_device_id].get(device_id, [])
+
+    def fetch(self, logical_device_id):
+        """
+        Fetch the ports of a logical device from VOLTHA.
+
+        Returns a dictionary device_id -> [port_no], or None in case of error.
+        """
+        r = VolthaClient.for_service(self.volt_service).logical_device_ports(logical_device_id, timeout=1)
+
+        if r.status_code != 200:
+            log.warn("It was not possible to fetch ports from VOLTHA for logical_device %s" % logical_device_id)
+            return None
+
+        logical_ports = r.json()['items']
+        log.debug("received logical device ports", logical_device_id=logical_device_id, logical_ports=logical_ports)
+
+        ports = {}
+        for p in logical_ports:
+            ports.setdefault(p['device_id'], []).append(p['ofp_port']['port_no'])
+        return ports